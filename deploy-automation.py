@@ -14,6 +14,16 @@ Usage:
   python3 deploy-automation.py              # Full automation for GitHub Pages
   python3 deploy-automation.py --local      # Local development with localhost URLs
   python3 deploy-automation.py --validate   # Validate existing deployment
+  python3 deploy-automation.py --publish-dir site  # Stage, validate and atomically publish to site/
+  python3 deploy-automation.py --catalog firmware-catalog.db  # Also update the SQLite build catalog
+  python3 deploy-automation.py query --channel stable --chip ESP32-S3 --addon sen55
+  python3 deploy-automation.py query --latest   # Latest build per model
+  python3 deploy-automation.py --quiet          # Only warnings and errors
+  python3 deploy-automation.py --log-format jsonl  # Machine-parseable JSON-lines log
+  python3 deploy-automation.py --precache all   # Let the service worker precache every binary
+  python3 deploy-automation.py --size-history firmware-size-history.json  # Fail on size budget regressions
+  python3 deploy-automation.py --no-cache       # Re-read every firmware file
+  python3 deploy-automation.py --retain 3       # Archive all but the 3 newest versions per lineage
 """
 
 import json
@@ -24,69 +34,467 @@ from pathlib import Path
 from datetime import datetime
 import subprocess
 import re
+import shutil
+import sqlite3
+import hashlib
+import struct
+import itertools
+import queue
+import threading
+import time
 
-class GitHubPagesAutomation:
-    def __init__(self, local_mode: bool = False):
-        self.local_mode = local_mode
-        self.firmware_dir = Path("firmware")
-        self.manifest_path = Path("manifest.json")
-        self.base_url = "http://localhost:5000/" if local_mode else ""
-        
-    def log(self, message: str):
-        """Log message with timestamp."""
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        print(f"[{timestamp}] {message}")
+try:
+    import fcntl
+except ImportError:
+    # Windows: staged publishing (symlink flip and lock) is POSIX-only
+    fcntl = None
+
+from firmware_grammar import FilenameGrammar, DEFAULT_CHANNELS
+
+# Page shell copied into every staged release next to the generated manifests
+SITE_FILES = ['index.html', 'css', 'sense360-logo.png', '_headers', 'sw.js']
+
+# Page shell and catalog files the service worker always precaches (see sw.js)
+PRECACHE_SHELL = ['index.html', 'css/style.css', 'sense360-logo.png', 'manifest.json']
+
+# Which binaries the service worker precaches: latest stable/any build per model
+# and variant, every build, or none
+PRECACHE_POLICIES = ['latest-stable', 'latest', 'all', 'none']
+
+# Hash of the current manifest.json; index.html refetches the catalog only when it changes
+CATALOG_DIGEST = 'catalog-digest.json'
+
+# Builds buffered between two streaming pipeline stages
+QUEUE_SIZE = 64
+
+# Fixed chunk size for per-part chunk hash lists (resumable, verifiable downloads)
+CHUNK_SIZE = 64 * 1024
+
+# Superseded builds move below this directory (archive/firmware/{Model}/{Variant}/...)
+ARCHIVE_DIR = Path("archive")
+
+# ESP image layout: merged factory images carry the partition table at 0x8000
+ESP_IMAGE_MAGIC = 0xE9
+ESP_PARTITION_TABLE_OFFSET = 0x8000
+ESP_PARTITION_MAGIC = b'\xaa\x50'
+
+# Load address ranges per chip id (from the image header), used to attribute
+# image segments to memory regions
+ESP_MEMORY_REGIONS = {
+    0: [(0x3F400000, 0x3F800000, 'DROM'), (0x3FF80000, 0x40000000, 'DRAM'), (0x40070000, 0x400C0000, 'IRAM'),
+        (0x400C0000, 0x400C2000, 'RTC'), (0x400D0000, 0x40400000, 'IROM'), (0x50000000, 0x50002000, 'RTC')],
+    2: [(0x3F000000, 0x3FF80000, 'DROM'), (0x3FFB0000, 0x40000000, 'DRAM'), (0x40020000, 0x40070000, 'IRAM'),
+        (0x40070000, 0x40072000, 'RTC'), (0x40080000, 0x40800000, 'IROM'), (0x50000000, 0x50002000, 'RTC')],
+    5: [(0x3C000000, 0x3C800000, 'DROM'), (0x3FC80000, 0x3FCE0000, 'DRAM'), (0x4037C000, 0x403E0000, 'IRAM'),
+        (0x42000000, 0x42800000, 'IROM'), (0x50000000, 0x50002000, 'RTC')],
+    9: [(0x3C000000, 0x3E000000, 'DROM'), (0x3FC88000, 0x3FD00000, 'DRAM'), (0x40370000, 0x403E0000, 'IRAM'),
+        (0x42000000, 0x44000000, 'IROM'), (0x50000000, 0x50002000, 'RTC'), (0x600FE000, 0x60100000, 'RTC')],
+    13: [(0x40800000, 0x40880000, 'RAM'), (0x42000000, 0x42800000, 'IROM'), (0x42800000, 0x43000000, 'DROM'),
+         (0x50000000, 0x50004000, 'RTC')],
+    16: [(0x40800000, 0x40850000, 'RAM'), (0x42000000, 0x42800000, 'IROM'), (0x42800000, 0x43000000, 'DROM'),
+         (0x50000000, 0x50001000, 'RTC')],
+}
+
+
+def hash_firmware_chunks(path: Path, chunk_size: int = CHUNK_SIZE) -> dict:
+    """Hash a file and each fixed-size chunk of it in a single streaming pass.
     
-    def extract_metadata_from_path(self, file_path: Path) -> dict:
-        """Extract metadata from Model/Variant directory structure and filename."""
-        parts = file_path.parts
-        
-        # Expected structure: firmware/{Model}/{Variant}/{filename}
-        if len(parts) < 4:
-            return None
+    chunk_root is the SHA-256 of the concatenated raw chunk digests, so a client
+    can check the chunk list itself before trusting any individual chunk hash.
+    """
+    file_digest = hashlib.sha256()
+    root_digest = hashlib.sha256()
+    chunks = []
+    size = 0
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            file_digest.update(chunk)
+            chunk_digest = hashlib.sha256(chunk).digest()
+            root_digest.update(chunk_digest)
+            chunks.append(chunk_digest.hex())
+            size += len(chunk)
+    return {
+        'size': size,
+        'sha256': file_digest.hexdigest(),
+        'chunk_size': chunk_size,
+        'chunk_root': root_digest.hexdigest(),
+        'chunks': chunks
+    }
+
+
+def parse_esp_image(path: Path) -> dict:
+    """Read the application image header and segment table of a firmware file.
+    
+    Merged factory images (bootloader at 0) are followed through the partition
+    table to the first app partition; plain app images are read from offset 0.
+    Only headers are read. Returns None if the file is not an ESP image.
+    """
+    with open(path, 'rb') as f:
+        def read_at(offset: int, length: int) -> bytes:
+            f.seek(offset)
+            return f.read(length)
         
-        model = parts[-3]        # Model name (e.g., "Sense360-MS")
-        variant = parts[-2]      # Variant name (e.g., "Standard")
-        filename = file_path.name
+        app_offset, partition_size = 0, None
+        table = read_at(ESP_PARTITION_TABLE_OFFSET, 0xC00)
+        for start in range(0, len(table) - 31, 32):
+            entry = table[start:start + 32]
+            if entry[:2] != ESP_PARTITION_MAGIC:
+                break
+            partition_type, _, offset, size = struct.unpack('<BBII', entry[2:12])
+            if partition_type == 0 and read_at(offset, 1) == bytes([ESP_IMAGE_MAGIC]):
+                app_offset, partition_size = offset, size
+                break
         
-        # Parse filename: {Model}-{Variant}-[sensor-addon-]v{Version}-{Channel}.bin
-        # Handle both standard and sensor-specific variants
-        expected_prefix = f"{model}-{variant}-"
-        if not filename.startswith(expected_prefix):
-            return None
-            
-        # Extract everything after the model-variant prefix
-        name_part = filename[len(expected_prefix):]
-        if name_part.endswith('.bin'):
-            name_part = name_part[:-4]
-        elif name_part.endswith('.md'):
-            name_part = name_part[:-3]
-        
-        # Check if this is a sensor-specific variant
-        sensor_addon = None
-        if name_part.startswith('sen55-hlk2450-v'):
-            sensor_addon = 'sen55-hlk2450'
-            name_part = name_part[len('sen55-hlk2450-v'):]  # Remove sensor addon prefix
-        elif name_part.startswith('v'):
-            name_part = name_part[1:]  # Remove 'v' prefix
-        else:
+        # 8-byte common header followed by the 16-byte extended header
+        header = read_at(app_offset, 24)
+        if len(header) < 24 or header[0] != ESP_IMAGE_MAGIC:
             return None
+        segment_count = header[1]
+        chip_id = struct.unpack('<H', header[12:14])[0]
+        regions = ESP_MEMORY_REGIONS.get(chip_id, [])
         
-        # Split by hyphens to get version-channel
-        parts = name_part.split('-')
-        if len(parts) < 2:
-            return None
+        segments = {}
+        offset = app_offset + 24
+        for _ in range(segment_count):
+            segment_header = read_at(offset, 8)
+            if len(segment_header) < 8:
+                return None
+            load_address, length = struct.unpack('<II', segment_header)
+            region = next((name for low, high, name in regions if low <= load_address < high), 'other')
+            segments[region] = segments.get(region, 0) + length
+            offset += 8 + length
+    
+    return {
+        'chip_id': chip_id,
+        'app_offset': app_offset,
+        'app_size': offset - app_offset,
+        'partition_size': partition_size,
+        'segments': segments
+    }
+
+
+def bounded_stage(items, maxsize: int = QUEUE_SIZE):
+    """Run a generator stage in a worker thread, handing results over a bounded queue.
+    
+    Order is preserved and the producer blocks once maxsize items are waiting,
+    so memory stays bounded no matter how many items flow through. If the
+    consumer stops early, the producer notices within a poll interval, closes
+    its input and exits instead of waiting on the full queue forever.
+    """
+    results = queue.Queue(maxsize=maxsize)
+    done = object()
+    stop = threading.Event()
+    
+    def hand_over(item) -> bool:
+        while not stop.is_set():
+            try:
+                results.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+    
+    def produce():
+        try:
+            for item in items:
+                if not hand_over(item):
+                    break
+        except BaseException as e:
+            hand_over(e)
+            return
+        finally:
+            if stop.is_set() and hasattr(items, 'close'):
+                items.close()
+        hand_over(done)
+    
+    threading.Thread(target=produce, daemon=True).start()
+    try:
+        while True:
+            item = results.get()
+            if item is done:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+
+
+class AutomationLogger:
+    """Leveled, buffered logger with text and JSON-lines output.
+    
+    Per-file events go through count(): at normal verbosity they only bump a
+    counter that summary() reports once, at --verbose each one is also logged.
+    Lines are buffered and written in batches; call flush() before exiting.
+    """
+    
+    LEVELS = {'error': 0, 'warning': 1, 'info': 2, 'debug': 3}
+    VERBOSITY = {'quiet': 1, 'normal': 2, 'verbose': 3}
+    
+    def __init__(self, verbosity: str = 'normal', log_format: str = 'text', stream=None, buffer_lines: int = 256):
+        self.threshold = self.VERBOSITY[verbosity]
+        self.log_format = log_format
+        self.stream = stream
+        self.buffer_lines = buffer_lines
+        self.buffer = []
+        self.counters = {}
+        self.lock = threading.Lock()
+        self._stamp_second = None
+        self._stamp = ''
+    
+    def _timestamp(self, now: float) -> str:
+        # Formatting the clock is the costly part; do it once per second
+        second = int(now)
+        if second != self._stamp_second:
+            self._stamp_second = second
+            self._stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(second))
+        return self._stamp
+    
+    def __call__(self, message: str, level: str = 'info', event: str = 'message', **fields):
+        if self.LEVELS[level] > self.threshold:
+            return
+        now = time.time()
+        with self.lock:
+            if self.log_format == 'jsonl':
+                record = {'ts': round(now, 3), 'level': level, 'event': event, 'msg': message}
+                record.update(fields)
+                self.buffer.append(json.dumps(record, ensure_ascii=False, default=str))
+            else:
+                self.buffer.append(f"[{self._timestamp(now)}] {message}")
+            if len(self.buffer) >= self.buffer_lines or level == 'error':
+                self._flush_locked()
+    
+    def error(self, message: str, event: str = 'error', **fields):
+        self(message, 'error', event, **fields)
+    
+    def warning(self, message: str, event: str = 'warning', **fields):
+        self(message, 'warning', event, **fields)
+    
+    def debug(self, message: str, event: str = 'message', **fields):
+        self(message, 'debug', event, **fields)
+    
+    def count(self, counter: str, message: str = None, **fields):
+        """Record a per-file event; the message itself is only logged at --verbose."""
+        with self.lock:
+            self.counters[counter] = self.counters.get(counter, 0) + 1
+        if message and self.threshold >= self.LEVELS['debug']:
+            self(message, 'debug', counter, **fields)
+    
+    def summary(self):
+        """Log the aggregated per-file counters and reset them."""
+        with self.lock:
+            counters, self.counters = self.counters, {}
+        if counters:
+            text = ', '.join(f"{name}={value}" for name, value in sorted(counters.items()))
+            self(f"📊 {text}", event='counters', counters=counters)
+    
+    def _flush_locked(self):
+        if self.buffer:
+            (self.stream or sys.stdout).write('\n'.join(self.buffer) + '\n')
+            self.buffer.clear()
+    
+    def flush(self):
+        with self.lock:
+            self._flush_locked()
+        (self.stream or sys.stdout).flush()
+
+
+class StreamingManifestWriter:
+    """Write manifest.json one build at a time, byte-identical to json.dump(indent=2).
+    
+    The SHA-256 of the written bytes is kept as they stream out, so sha256 is
+    available once the writer is closed without reading the file back.
+    """
+    
+    def __init__(self, path: Path, header: dict):
+        self.path = Path(path)
+        self.header = header
+        self.count = 0
+        self.temp_path = self.path.with_name(self.path.name + '.tmp')
+        self.file = None
+        self.digest = hashlib.sha256()
+        self.sha256 = None
+    
+    def _write(self, text: str):
+        self.file.write(text)
+        self.digest.update(text.encode('utf-8'))
+    
+    def __enter__(self):
+        self.file = open(self.temp_path, 'w', encoding='utf-8', newline='\n')
+        self._write(json.dumps(self.header, indent=2)[:-2] + ',\n  "builds": [')
+        return self
+    
+    def write(self, build: dict):
+        separator = ',\n' if self.count else '\n'
+        self._write(separator + json.dumps(build, indent=2).replace('\n', '\n    ').join(['    ', '']))
+        self.count += 1
+    
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self._write('\n  ]\n}' if self.count else ']\n}')
+            self.sha256 = self.digest.hexdigest()
+        self.file.close()
+        if exc_type is None:
+            os.replace(self.temp_path, self.path)
+        else:
+            self.temp_path.unlink(missing_ok=True)
+        return False
+
+
+def iter_git_blob_ids(root: Path):
+    """Yield (path, blob ID) for files under root that are unchanged since HEAD.
+    
+    One ls-tree call lists the committed blobs and one diff call drops files
+    modified, staged or deleted since HEAD, so every yielded ID describes the
+    file as it is on disk. The listing is read as a stream, so memory does not
+    grow with the tree. Yields nothing outside a git work tree.
+    """
+    try:
+        changed = subprocess.run(['git', 'diff', 'HEAD', '--name-only', '--relative', '-z', '--', str(root)],
+                                 capture_output=True, timeout=60)
+    except (subprocess.TimeoutExpired, FileNotFoundError):
+        return
+    if changed.returncode != 0:
+        return
+    modified = set(changed.stdout.decode('utf-8', 'surrogateescape').split('\0'))
+    
+    try:
+        tree = subprocess.Popen(['git', 'ls-tree', '-r', '-z', 'HEAD', '--', str(root)],
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    except FileNotFoundError:
+        return
+    with tree:
+        pending = b''
+        for chunk in iter(lambda: tree.stdout.read(1 << 16), b''):
+            *records, pending = (pending + chunk).split(b'\0')
+            for record in records:
+                info, tab, path = record.decode('utf-8', 'surrogateescape').partition('\t')
+                if tab and path not in modified:
+                    _, object_type, object_id = info.split()
+                    if object_type == 'blob':
+                        yield path, object_id
+
+
+class FirmwareCache:
+    """Derived per-file data (parsed notes, chunk hashes, image headers, build dates)
+    keyed by content identity, so unchanged files are never reopened.
+    
+    Files unchanged since HEAD are keyed by their git blob ID; untracked and
+    locally modified files fall back to a size and mtime key. Entries live in a
+    SQLite file and are read one at a time, so memory stays flat however many
+    builds are cached.
+    """
+    
+    VERSION = 2
+    
+    def __init__(self, path: Path, root: Path = Path("firmware")):
+        self.path = Path(path)
+        try:
+            self.conn = self.open()
+        except sqlite3.DatabaseError:
+            # Not a cache database (e.g. an old JSON cache): start over
+            self.path.unlink(missing_ok=True)
+            self.conn = self.open()
+        # Lookups of the current run; kept out of the cache file itself
+        self.conn.executescript("""
+            CREATE TEMP TABLE blob_ids (path TEXT PRIMARY KEY, blob_id TEXT NOT NULL);
+            CREATE TEMP TABLE used (path TEXT PRIMARY KEY);
+        """)
+        self.conn.executemany("INSERT OR REPLACE INTO blob_ids VALUES (?, ?)", iter_git_blob_ids(root))
+        self.tracked_files = self.conn.execute("SELECT COUNT(*) FROM blob_ids").fetchone()[0]
+        self.cached_files = self.conn.execute("SELECT COUNT(DISTINCT path) FROM entries").fetchone()[0]
+        self.lock = threading.Lock()
+    
+    def open(self) -> sqlite3.Connection:
+        # Shared by the parse and enrich stage threads; every access holds self.lock
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        if conn.execute("PRAGMA user_version").fetchone()[0] != self.VERSION:
+            conn.executescript(f"""
+                DROP TABLE IF EXISTS entries;
+                CREATE TABLE entries (
+                    path TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    PRIMARY KEY (path, kind)
+                );
+                PRAGMA user_version = {self.VERSION};
+            """)
+        return conn
+    
+    def key(self, path: Path) -> str:
+        with self.lock:
+            row = self.conn.execute("SELECT blob_id FROM blob_ids WHERE path = ?", (path.as_posix(),)).fetchone()
+        if row:
+            return f"git:{row[0]}"
+        stat = path.stat()
+        return f"stat:{stat.st_size}:{stat.st_mtime_ns}"
+    
+    def get(self, path: Path, kind: str):
+        """Return cached data of this kind for path, or None if missing or stale."""
+        key = self.key(path)
+        with self.lock:
+            self.conn.execute("INSERT OR IGNORE INTO used VALUES (?)", (path.as_posix(),))
+            row = self.conn.execute("SELECT value FROM entries WHERE path = ? AND kind = ? AND key = ?",
+                                    (path.as_posix(), kind, key)).fetchone()
+        return json.loads(row[0]) if row else None
+    
+    def put(self, path: Path, kind: str, value):
+        key = self.key(path)
+        with self.lock:
+            self.conn.execute("INSERT OR IGNORE INTO used VALUES (?)", (path.as_posix(),))
+            self.conn.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)",
+                              (path.as_posix(), kind, key, json.dumps(value, separators=(',', ':'))))
+    
+    def save(self):
+        """Commit the cache, dropping entries for files not seen this run."""
+        with self.lock:
+            self.conn.execute("DELETE FROM entries WHERE path NOT IN (SELECT path FROM used)")
+            self.conn.commit()
+    
+    def close(self):
+        """Close the database; changes not saved are discarded."""
+        with self.lock:
+            self.conn.close()
+
+
+class GitHubPagesAutomation:
+    def __init__(self, local_mode: bool = False, output_dir: Path = None, catalog_path: Path = None,
+                 channels: list = None, addon_tokens: list = None, logger: AutomationLogger = None,
+                 precache_policy: str = 'latest-stable', size_history_path: Path = None,
+                 size_budgets_path: Path = None, max_growth_percent: float = None, cache_path: Path = None,
+                 retain: int = None):
+        self.local_mode = local_mode
+        self.precache_policy = precache_policy
+        self.precache_candidates = {}
+        self.precache_build_count = 0
+        self.log = logger or AutomationLogger()
+        self.grammar = FilenameGrammar(channels=channels or DEFAULT_CHANNELS, addon_tokens=addon_tokens)
+        self.catalog_path = Path(catalog_path) if catalog_path else None
+        self.size_history_path = Path(size_history_path) if size_history_path else None
+        self.size_budgets_path = Path(size_budgets_path) if size_budgets_path else None
+        self.max_growth_percent = max_growth_percent
+        self.size_history = None
+        self.catalog = None
+        self.catalog_changes = (0, 0)
+        self.cache_path = Path(cache_path) if cache_path else None
+        self.cache = None
+        self.firmware_dir = Path("firmware")
+        self.output_dir = Path(output_dir) if output_dir else Path(".")
+        self.manifest_path = self.output_dir / "manifest.json"
+        self.retain = retain
+        self.archive_firmware_dir = ARCHIVE_DIR / self.firmware_dir
+        self.archived_builds = 0
+        self.pending_archive = {}
+        self.base_url = "http://localhost:5000/" if local_mode else ""
         
-        version = parts[0]  # Version (e.g., "1.0.0")
-        channel = parts[1]  # Channel (e.g., "stable")
+    def extract_metadata_from_path(self, file_path: Path) -> dict:
+        """Extract metadata from Model/Variant directory structure and filename.
         
-        return {
-            'model': model,
-            'variant': variant,
-            'sensor_addon': sensor_addon,
-            'version': version,
-            'channel': channel
-        }
+        Returns None when the path does not follow the naming grammar; use
+        self.grammar.classify() to learn why.
+        """
+        return self.grammar.match(file_path.as_posix())
     
     def get_chip_family_mapping(self, chip_family: str) -> str:
         """Map chip family to ESP Web Tools format."""
@@ -100,16 +508,24 @@ class GitHubPagesAutomation:
         }
         return mapping.get(chip_family, chip_family)
     
-    def get_firmware_metadata_from_release_notes(self, model: str, variant: str, version: str, channel: str, sensor_addon: str = None) -> dict:
-        """Get firmware metadata from release notes file."""
-        # Create release notes filename (ensure version has 'v' prefix)
-        version_with_v = version if version.startswith('v') else f"v{version}"
-        if sensor_addon:
-            release_notes_filename = f"{model}-{variant}-{sensor_addon}-{version_with_v}-{channel}.md"
-        else:
-            release_notes_filename = f"{model}-{variant}-{version_with_v}-{channel}.md"
-        # Look for release notes in the Model/Variant directory
-        release_notes_path = self.firmware_dir / model / variant / release_notes_filename
+    def get_firmware_metadata_from_release_notes(self, model: str, variant: str, version: str, channel: str, sensor_addon: str = None,
+                                                 release_notes_path: Path = None) -> dict:
+        """Get firmware metadata from release notes file.
+        
+        release_notes_path defaults to the notes in the firmware Model/Variant
+        directory; pass the path next to the binary for builds kept elsewhere,
+        such as the archive.
+        """
+        if release_notes_path is None:
+            # Create release notes filename (ensure version has 'v' prefix)
+            version_with_v = version if version.startswith('v') else f"v{version}"
+            if sensor_addon:
+                release_notes_filename = f"{model}-{variant}-{sensor_addon}-{version_with_v}-{channel}.md"
+            else:
+                release_notes_filename = f"{model}-{variant}-{version_with_v}-{channel}.md"
+            # Look for release notes in the Model/Variant directory
+            release_notes_path = self.firmware_dir / model / variant / release_notes_filename
+        release_notes_filename = release_notes_path.name
         
         # Default metadata
         metadata = {
@@ -127,9 +543,15 @@ class GitHubPagesAutomation:
         }
         
         if not release_notes_path.exists():
-            self.log(f"⚠️  No release notes found for {release_notes_filename}, using defaults")
+            self.log.count('release_notes_missing', f"⚠️  No release notes found for {release_notes_filename}, using defaults")
             return metadata
         
+        if self.cache is not None:
+            cached = self.cache.get(release_notes_path, 'notes')
+            if cached is not None:
+                self.log.count('cache_hits', f"  ♻️  Cached release notes for {release_notes_filename}")
+                return cached
+        
         try:
             with open(release_notes_path, 'r', encoding='utf-8') as f:
                 content = f.read()
@@ -205,11 +627,13 @@ class GitHubPagesAutomation:
                 changelog_text = changelog_match.group(1).strip()
                 metadata['changelog'] = [line.strip('- ').strip() for line in changelog_text.split('\n') if line.strip().startswith('-')]
             
-            self.log(f"📋 Loaded release notes for {release_notes_filename}")
+            self.log.count('release_notes_loaded', f"📋 Loaded release notes for {release_notes_filename}")
+            if self.cache is not None:
+                self.cache.put(release_notes_path, 'notes', metadata)
             return metadata
             
         except Exception as e:
-            self.log(f"⚠️  Error reading release notes {release_notes_filename}: {e}")
+            self.log.warning(f"⚠️  Error reading release notes {release_notes_filename}: {e}", file=release_notes_filename)
             return metadata
     
     def clean_orphaned_manifests(self) -> bool:
@@ -217,8 +641,8 @@ class GitHubPagesAutomation:
         try:
             # Find all existing firmware manifest files with multiple patterns
             manifest_files = []
-            for pattern in ['firmware-*.json', 'firmware*.json']:
-                manifest_files.extend(list(Path('.').glob(pattern)))
+            for pattern in ['firmware-*.json', 'firmware*.json', 'archive-firmware-*.json']:
+                manifest_files.extend(list(self.output_dir.glob(pattern)))
             
             # Remove duplicates
             manifest_files = list(set(manifest_files))
@@ -230,25 +654,25 @@ class GitHubPagesAutomation:
                     try:
                         if manifest_file.exists():
                             manifest_file.unlink()
-                            self.log(f"  ✓ Removed {manifest_file}")
+                            self.log.count('manifests_removed', f"  ✓ Removed {manifest_file}")
                         else:
-                            self.log(f"  ℹ️  {manifest_file} already removed")
+                            self.log.debug(f"  ℹ️  {manifest_file} already removed")
                     except Exception as e:
-                        self.log(f"  ✗ Failed to remove {manifest_file}: {e}")
+                        self.log.error(f"  ✗ Failed to remove {manifest_file}: {e}", file=str(manifest_file))
                         cleanup_success = False
                 
                 # Verify cleanup worked
-                remaining_files = list(Path('.').glob('firmware-*.json'))
+                remaining_files = list(self.output_dir.glob('firmware-*.json'))
                 if remaining_files:
-                    self.log(f"  ⚠️  {len(remaining_files)} files still remain:")
+                    self.log.warning(f"  ⚠️  {len(remaining_files)} files still remain:")
                     for remaining_file in remaining_files:
-                        self.log(f"    - {remaining_file}")
+                        self.log.warning(f"    - {remaining_file}", file=str(remaining_file))
                         # Force remove if still exists
                         try:
                             remaining_file.unlink()
-                            self.log(f"    ✓ Force removed {remaining_file}")
+                            self.log.count('manifests_removed', f"    ✓ Force removed {remaining_file}")
                         except Exception as e:
-                            self.log(f"    ✗ Force removal failed: {e}")
+                            self.log.error(f"    ✗ Force removal failed: {e}", file=str(remaining_file))
                             cleanup_success = False
                 
                 if not cleanup_success:
@@ -257,18 +681,18 @@ class GitHubPagesAutomation:
                 self.log("🧹 No existing manifest files to clean up")
             
             # Double-check cleanup was successful
-            final_check = list(Path('.').glob('firmware-*.json'))
+            final_check = list(self.output_dir.glob('firmware-*.json'))
             if final_check:
-                self.log(f"ERROR: {len(final_check)} manifest files still exist after cleanup!")
+                self.log.error(f"ERROR: {len(final_check)} manifest files still exist after cleanup!")
                 for remaining in final_check:
-                    self.log(f"  - {remaining}")
+                    self.log.error(f"  - {remaining}", file=str(remaining))
                 return False
             
             self.log("✅ Cleanup verified: All firmware-*.json files removed")
             return True
             
         except Exception as e:
-            self.log(f"ERROR: Failed to clean up orphaned manifests: {e}")
+            self.log.error(f"ERROR: Failed to clean up orphaned manifests: {e}")
             return False
     
     def get_build_date(self, file_path: Path, release_metadata: dict = None) -> str:
@@ -276,9 +700,15 @@ class GitHubPagesAutomation:
         # First priority: Release Date from .md file
         if release_metadata and 'release_date' in release_metadata:
             release_date = release_metadata['release_date']
-            self.log(f"  📅 Using release date from .md file: {release_date}")
+            self.log.count('build_date_release_notes', f"  📅 Using release date from .md file: {release_date}")
             return release_date
         
+        if self.cache is not None:
+            cached = self.cache.get(file_path, 'build_date')
+            if cached is not None:
+                self.log.count('cache_hits', f"  ♻️  Cached build date for {file_path.name}: {cached}")
+                return cached
+        
         try:
             # Second priority: git commit date for this file
             result = subprocess.run(
@@ -290,7 +720,10 @@ class GitHubPagesAutomation:
             
             if result.returncode == 0 and result.stdout.strip():
                 git_date = result.stdout.strip()
-                self.log(f"  📅 Using git commit date: {git_date}")
+                self.log.count('build_date_git', f"  📅 Using git commit date: {git_date}")
+                # Only dates of committed content are stable under its blob key
+                if self.cache is not None and self.cache.key(file_path).startswith('git:'):
+                    self.cache.put(file_path, 'build_date', git_date)
                 return git_date
             
         except (subprocess.TimeoutExpired, subprocess.CalledProcessError, FileNotFoundError):
@@ -299,93 +732,179 @@ class GitHubPagesAutomation:
         
         # Last resort: file modification time
         file_date = datetime.fromtimestamp(file_path.stat().st_mtime).isoformat()
-        self.log(f"  📅 Using file modification date: {file_date}")
+        self.log.count('build_date_mtime', f"  📅 Using file modification date: {file_date}")
         return file_date
     
-    def scan_firmware_directory(self) -> list:
-        """Scan firmware directory and create builds list."""
-        builds = []
+    def discover_firmware(self, report_rejected: bool = False, root: Path = None):
+        """Discover stage: yield (path, metadata) for every recognised .bin, in manifest order.
         
-        if not self.firmware_dir.exists():
-            self.log(f"ERROR: Firmware directory {self.firmware_dir} does not exist")
-            return builds
-            
-        for bin_file in self.firmware_dir.rglob("*.bin"):
-            metadata = self.extract_metadata_from_path(bin_file)
-            
-            if metadata:
-                # Create relative path for GitHub Pages
-                relative_path = str(bin_file.relative_to(Path('.')))
-                
-                # Get release notes metadata
-                release_metadata = self.get_firmware_metadata_from_release_notes(
-                    metadata['model'], 
-                    metadata['variant'], 
-                    metadata['version'], 
-                    metadata['channel'],
-                    metadata.get('sensor_addon')
-                )
-                
-                # Create variant display name
-                variant_display = metadata['variant']
-                if metadata.get('sensor_addon'):
-                    variant_display = f"{metadata['variant']}-{metadata['sensor_addon']}"
-                
-                build = {
-                    "model": metadata['model'],
-                    "variant": variant_display,
-                    "device_type": release_metadata.get('device_type', metadata['model']),
-                    "version": metadata['version'],
-                    "channel": metadata['channel'],
-                    "description": release_metadata['description'],
-                    "chipFamily": self.get_chip_family_mapping(release_metadata.get('chip_family', 'ESP32-S3')),
-                    "builtin_sensors": release_metadata.get('builtin_sensors', []),
-                    "addon_sensors": release_metadata.get('addon_sensors', []),
-                    "sensor_addon": metadata.get('sensor_addon'),
-                    "parts": [{
-                        "path": relative_path,
-                        "offset": 0
-                    }],
-                    "build_date": self.get_build_date(bin_file, release_metadata),
-                    "file_size": bin_file.stat().st_size,
-                    "improv": True,
-                    "features": release_metadata['features'][:5] if release_metadata['features'] else [],  # Limit to first 5 features
-                    "hardware_requirements": release_metadata['hardware_requirements'][:3] if release_metadata['hardware_requirements'] else [],  # Limit to first 3 requirements
-                    "known_issues": release_metadata['known_issues'][:3] if release_metadata['known_issues'] else [],  # Limit to first 3 issues
-                    "changelog": release_metadata['changelog'][:5] if release_metadata['changelog'] else []  # Limit to first 5 changelog items
-                }
-                
-                builds.append(build)
-                self.log(f"📦 Found: {bin_file.name} - {metadata['model']} {metadata['variant']} v{metadata['version']}")
+        Files are sorted one model directory at a time, so only a single model's
+        paths and filename metadata are held; release notes, dates and sizes are
+        filled in later by the streaming stages. With report_rejected, every .bin
+        that does not follow the naming grammar is logged with the reason. root
+        defaults to the firmware directory; pass the archive directory to walk
+        archived builds instead. Builds the retention policy is about to archive
+        are already counted as archived, at their current location.
+        """
+        pending = {}
+        if root is None:
+            root = self.firmware_dir
+            if not root.exists():
+                self.log.error(f"ERROR: Firmware directory {root} does not exist")
+                return
+        elif root == self.archive_firmware_dir:
+            for bin_file, (_, metadata) in self.pending_archive.items():
+                pending.setdefault(bin_file.parent.parent.name, []).append((bin_file, metadata))
         
-        # Sort by model, then variant, then version
-        builds.sort(key=lambda x: (x['model'], x['variant'], x['version']))
-        return builds
+        # Expected structure: firmware/{Model}/{Variant}/{filename}
+        model_names = {d.name for d in root.iterdir() if d.is_dir()} if root.exists() else set()
+        for model_name in sorted(model_names | set(pending)):
+            entries = list(pending.get(model_name, []))
+            for bin_file in (root / model_name).glob("*/*.bin"):
+                if bin_file in self.pending_archive:
+                    continue
+                metadata, reason = self.grammar.classify(bin_file.as_posix())
+                if metadata:
+                    entries.append((bin_file, metadata))
+                elif report_rejected:
+                    self.log.warning(f"⚠️  Skipped {bin_file}: {reason}", event='file_rejected', file=str(bin_file), reason=reason)
+            
+            # Sort by variant (including sensor addon), then version
+            entries.sort(key=lambda entry: (
+                f"{entry[1]['variant']}-{entry[1]['sensor_addon']}" if entry[1].get('sensor_addon') else entry[1]['variant'],
+                entry[1]['version']
+            ))
+            yield from entries
     
-    def create_main_manifest(self, builds: list) -> bool:
-        """Create main manifest.json file."""
-        try:
-            manifest = {
-                "name": "Sense360 ESP32 Firmware",
-                "version": "1.0.0",
-                "home_assistant_domain": "esphome",
-                "new_install_skip_erase": False,
-                "builds": builds
-            }
+    def hash_chunks(self, bin_file: Path) -> dict:
+        """hash_firmware_chunks(), served from the change-detection cache when possible."""
+        if self.cache is not None:
+            cached = self.cache.get(bin_file, 'hashes')
+            if cached is not None:
+                self.log.count('cache_hits', f"  ♻️  Cached chunk hashes for {bin_file.name}")
+                return cached
+        hashes = hash_firmware_chunks(bin_file)
+        self.log.count('binaries_hashed', f"  #️⃣  Hashed {bin_file.name}")
+        if self.cache is not None:
+            self.cache.put(bin_file, 'hashes', hashes)
+        return hashes
+    
+    def inspect_image(self, bin_file: Path) -> dict:
+        """parse_esp_image(), served from the change-detection cache when possible."""
+        if self.cache is not None:
+            cached = self.cache.get(bin_file, 'image')
+            if cached is not None:
+                return cached
+        image = parse_esp_image(bin_file) or {}
+        if self.cache is not None:
+            self.cache.put(bin_file, 'image', image)
+        return image
+    
+    def published_path(self, bin_file: Path) -> Path:
+        """Where a binary is served from once the run is finalized."""
+        pending = self.pending_archive.get(bin_file)
+        return pending[0] if pending else bin_file
+    
+    def source_path(self, path: str) -> Path:
+        """Where the binary published at path is read from during this run."""
+        for bin_file, (target, _) in self.pending_archive.items():
+            if str(target) == path:
+                return bin_file
+        return Path(path)
+    
+    def iter_firmware_paths(self, root: Path = None):
+        """Yield relative .bin paths in manifest order."""
+        for bin_file, _ in self.discover_firmware(root=root):
+            yield str(bin_file.relative_to(Path('.')))
+    
+    def parse_release_notes(self, entries):
+        """Parse stage: attach release notes metadata to each discovered entry."""
+        for bin_file, metadata in entries:
+            release_metadata = self.get_firmware_metadata_from_release_notes(
+                metadata['model'], 
+                metadata['variant'], 
+                metadata['version'], 
+                metadata['channel'],
+                metadata.get('sensor_addon'),
+                release_notes_path=bin_file.with_suffix('.md')
+            )
+            yield bin_file, metadata, release_metadata
+    
+    def enrich_builds(self, parsed):
+        """Enrich stage: turn parsed entries into manifest build entries."""
+        for bin_file, metadata, release_metadata in parsed:
+            # Create relative path for GitHub Pages
+            relative_path = str(self.published_path(bin_file.relative_to(Path('.'))))
             
-            with open(self.manifest_path, 'w') as f:
-                json.dump(manifest, f, indent=2)
+            # Create variant display name
+            variant_display = metadata['variant']
+            if metadata.get('sensor_addon'):
+                variant_display = f"{metadata['variant']}-{metadata['sensor_addon']}"
             
-            self.log(f"✓ Created manifest.json with {len(builds)} builds")
-            return True
+            build = {
+                "model": metadata['model'],
+                "variant": variant_display,
+                "device_type": release_metadata.get('device_type', metadata['model']),
+                "version": metadata['version'],
+                "channel": metadata['channel'],
+                "description": release_metadata['description'],
+                "chipFamily": self.get_chip_family_mapping(release_metadata.get('chip_family', 'ESP32-S3')),
+                "builtin_sensors": release_metadata.get('builtin_sensors', []),
+                "addon_sensors": release_metadata.get('addon_sensors', []),
+                "sensor_addon": metadata.get('sensor_addon'),
+                "parts": [{
+                    "path": relative_path,
+                    "offset": 0,
+                    **self.hash_chunks(bin_file)
+                }],
+                "build_date": self.get_build_date(bin_file, release_metadata),
+                "file_size": bin_file.stat().st_size,
+                "improv": True,
+                "features": release_metadata['features'][:5] if release_metadata['features'] else [],  # Limit to first 5 features
+                "hardware_requirements": release_metadata['hardware_requirements'][:3] if release_metadata['hardware_requirements'] else [],  # Limit to first 3 requirements
+                "known_issues": release_metadata['known_issues'][:3] if release_metadata['known_issues'] else [],  # Limit to first 3 issues
+                "changelog": release_metadata['changelog'][:5] if release_metadata['changelog'] else []  # Limit to first 5 changelog items
+            }
             
-        except Exception as e:
-            self.log(f"ERROR: Failed to create manifest.json: {e}")
-            return False
+            self.log.count('builds_found', f"📦 Found: {bin_file.name} - {metadata['model']} {metadata['variant']} v{metadata['version']}")
+            yield build
     
-    def create_individual_manifests(self, builds: list) -> bool:
-        """Create individual manifest files for ESP Web Tools."""
-        try:
+    def iter_builds(self, entries):
+        """Stream build entries through the parse and enrich stages.
+        
+        Each stage runs in its own worker thread connected by a bounded queue, so
+        release notes parsing and git lookups overlap with writing while at most
+        QUEUE_SIZE builds per stage are held in memory.
+        """
+        parsed = bounded_stage(self.parse_release_notes(entries))
+        return bounded_stage(self.enrich_builds(parsed))
+    
+    def scan_firmware_directory(self) -> list:
+        """Scan firmware directory and create builds list."""
+        return list(self.iter_builds(self.discover_firmware()))
+    
+    def write_manifests(self, builds, manifest_path: Path = None, prefix: str = 'firmware'):
+        """Write stage: stream manifest.json and firmware-N.json, yielding each build once written.
+        
+        manifest.json is written incrementally to a temporary file and moved into
+        place only after the last build, so readers never see a partial manifest.
+        Part chunk hash lists go only into the individual manifests that clients
+        download from; manifest.json keeps the full-file hash and chunk root.
+        Archived builds go to archive-manifest.json and archive-firmware-N.json
+        through manifest_path and prefix.
+        """
+        manifest_path = manifest_path or self.manifest_path
+        header = {
+            "name": "Sense360 ESP32 Firmware",
+            "version": "1.0.0",
+            "home_assistant_domain": "esphome",
+            "new_install_skip_erase": False
+        }
+        if manifest_path == self.manifest_path and self.archived_builds:
+            # Lets the page offer archived builds without downloading their manifest
+            header["archive"] = {"manifest": "archive-manifest.json", "builds": self.archived_builds}
+        
+        with StreamingManifestWriter(manifest_path, header) as manifest_writer:
             for index, build in enumerate(builds):
                 individual_manifest = {
                     "name": f"Sense360 ESP32 Firmware - {build['device_type']}",
@@ -394,73 +913,214 @@ class GitHubPagesAutomation:
                     "new_install_skip_erase": False,
                     "builds": [{
                         "chipFamily": build['chipFamily'],
-                        "parts": [{
-                            "path": build['parts'][0]['path'],
-                            "offset": 0
-                        }],
+                        "parts": build['parts'],
                         "improv": True
                     }]
                 }
                 
-                manifest_filename = f'firmware-{index}.json'
-                with open(manifest_filename, 'w') as f:
+                manifest_filename = f'{prefix}-{index}.json'
+                with open(self.output_dir / manifest_filename, 'w') as f:
                     json.dump(individual_manifest, f, indent=2)
                 
-                self.log(f"✓ Created {manifest_filename} for {build['device_type']} v{build['version']}")
+                manifest_writer.write({
+                    **build,
+                    "parts": [{key: value for key, value in part.items() if key != 'chunks'} for part in build['parts']]
+                })
+                self.log.count('individual_manifests_written', f"✓ Created {manifest_filename} for {build['device_type']} v{build['version']}")
+                yield build
+        
+        self.log(f"✓ Created {manifest_path.name} with {manifest_writer.count} builds", event='manifest_written',
+                 manifest=manifest_path.name, builds=manifest_writer.count)
+        if manifest_path == self.manifest_path:
+            self.write_catalog_digest(manifest_writer.sha256, manifest_writer.count)
+    
+    def write_catalog_digest(self, sha256: str, builds: int):
+        """Write catalog-digest.json, the tiny file the page checks before refetching manifest.json."""
+        digest_path = self.output_dir / CATALOG_DIGEST
+        temp_path = digest_path.with_name(digest_path.name + '.tmp')
+        with open(temp_path, 'w') as f:
+            json.dump({'manifest': self.manifest_path.name, 'sha256': sha256, 'builds': builds}, f, indent=2)
+        os.replace(temp_path, digest_path)
+        self.log(f"✓ Created {CATALOG_DIGEST} ({sha256[:16]})", event='catalog_digest_written', sha256=sha256)
+    
+    def track_precache_candidates(self, builds):
+        """Pass-through stage remembering which builds the service worker should precache.
+        
+        Only one candidate per model and variant is kept (except for the 'all'
+        policy), so this stays small however many builds stream past.
+        """
+        self.precache_candidates = {}
+        self.precache_build_count = 0
+        for index, build in enumerate(builds):
+            self.precache_build_count = index + 1
+            policy = self.precache_policy
+            if policy == 'all' or policy == 'latest' or (policy == 'latest-stable' and build['channel'] == 'stable'):
+                key = index if policy == 'all' else (build['model'], build['variant'])
+                version_key = version_sort_key(build['version'])
+                current = self.precache_candidates.get(key)
+                if current is None or version_key > current[0]:
+                    self.precache_candidates[key] = (version_key, index, build['parts'])
+            yield build
+    
+    def track_sizes(self, builds):
+        """Pass-through stage recording each build in the size history, if one is kept."""
+        # Builds about to be archived are still read from their current location
+        inspect_image = lambda path: self.inspect_image(self.source_path(str(path)))
+        for build in builds:
+            if self.size_history is not None and self.size_history.record(build, inspect_image):
+                self.log.count('size_history_parsed', f"  📏 Parsed image segments of {build['parts'][0]['path']}")
+            yield build
+    
+    def check_size_budgets(self) -> bool:
+        """Fail if any lineage's latest build exceeds its budget.
+        
+        The updated history is only saved by finalize_run(), so a rejected build
+        never becomes the baseline for the next version.
+        """
+        try:
+            budgets = {}
+            if self.size_budgets_path and self.size_budgets_path.exists():
+                with open(self.size_budgets_path) as f:
+                    budgets = json.load(f)
+            if self.max_growth_percent is not None:
+                budgets = {**budgets, 'default': {**budgets.get('default', {}), 'max_growth_percent': self.max_growth_percent}}
+            
+            reports = self.size_history.check(budgets)
+        except Exception as e:
+            self.log.error(f"ERROR: Size history check failed: {e}")
+            return False
+        
+        violations = 0
+        for report in reports:
+            if report.get('growth'):
+                segments = ', '.join(f"{region} {delta:+,}" for region, delta in report['segment_growth'].items() if delta)
+                self.log(f"📏 {report['lineage']}: v{report['previous_version']} → v{report['version']} "
+                         f"{report['growth']:+,} bytes ({report['growth_percent']:+.2f}%)" + (f" [{segments}]" if segments else ""),
+                         event='size_growth', **{k: v for k, v in report.items() if k != 'violations'})
+            else:
+                self.log.count('size_lineages_unchanged', f"  📏 {report['lineage']}: v{report['version']} {report['size']:,} bytes")
+            for violation in report['violations']:
+                violations += 1
+                self.log.error(f"  ✗ {report['lineage']} v{report['version']}: {violation}", event='size_budget_exceeded',
+                               lineage=report['lineage'], version=report['version'], violation=violation)
+        
+        self.log(f"✓ Size history {self.size_history_path}: {len(reports)} lineages checked, {violations} budget violations",
+                 event='size_checked', lineages=len(reports), violations=violations)
+        return violations == 0
+    
+    def write_precache_manifest(self) -> bool:
+        """Write precache-manifest.json: URLs, SHA-256 revisions and sizes for sw.js.
+        
+        The list version is a hash of its entries, so any changed file or newly
+        selected binary gives the service worker a new version to sync to. Every
+        firmware-N.json is listed whatever the policy: they are tiny, and the
+        install button must never load an individual manifest from a different
+        release than the cached manifest.json it was picked from.
+        """
+        def file_entry(relative_path: str) -> dict:
+            path = self.output_dir / relative_path
+            return {
+                'url': relative_path,
+                'revision': FirmwareCatalog.file_sha256(path),
+                'size': path.stat().st_size
+            }
+        
+        try:
+            entries = [file_entry(name) for name in PRECACHE_SHELL if (self.output_dir / name).exists()]
+            entries.extend(file_entry(f'firmware-{index}.json') for index in range(self.precache_build_count))
+            
+            binaries = 0
+            for _, index, parts in sorted(self.precache_candidates.values(), key=lambda candidate: candidate[1]):
+                for part in parts:
+                    entries.append({'url': part['path'], 'revision': part['sha256'], 'size': part['size']})
+                    binaries += 1
             
+            precache_manifest = {
+                'version': hashlib.sha256(json.dumps(entries, sort_keys=True).encode()).hexdigest()[:16],
+                'policy': self.precache_policy,
+                'entries': entries
+            }
+            
+            precache_path = self.output_dir / 'precache-manifest.json'
+            temp_path = precache_path.with_name(precache_path.name + '.tmp')
+            with open(temp_path, 'w') as f:
+                json.dump(precache_manifest, f, indent=2)
+            os.replace(temp_path, precache_path)
+            
+            total_size = sum(entry['size'] for entry in entries)
+            self.log(f"✓ Created precache-manifest.json v{precache_manifest['version']}: {len(entries)} entries, "
+                     f"{binaries} binaries, {total_size / (1024 * 1024):.1f} MB",
+                     event='precache_written', version=precache_manifest['version'], entries=len(entries), binaries=binaries)
             return True
             
         except Exception as e:
-            self.log(f"ERROR: Failed to create individual manifests: {e}")
+            self.log.error(f"ERROR: Failed to create precache-manifest.json: {e}")
             return False
     
-    def validate_deployment(self, builds: list) -> bool:
-        """Validate all files exist and are accessible."""
+    def validate_deployment(self, firmware_paths) -> bool:
+        """Validate all files exist and are accessible.
+        
+        firmware_paths yields the relative .bin paths in manifest order.
+        """
         try:
             # Check main manifest
             if not self.manifest_path.exists():
-                self.log("ERROR: manifest.json not found")
-                return False
-            
-            # Validate main manifest content
-            with open(self.manifest_path) as f:
-                manifest_data = json.load(f)
-                
-            if len(manifest_data['builds']) != len(builds):
-                self.log(f"ERROR: Main manifest has {len(manifest_data['builds'])} builds but expected {len(builds)}")
+                self.log.error("ERROR: manifest.json not found")
                 return False
             
             # Check individual manifests
-            for index, build in enumerate(builds):
-                manifest_file = Path(f'firmware-{index}.json')
+            build_count = 0
+            for index, relative_path in enumerate(firmware_paths):
+                build_count += 1
+                manifest_file = self.output_dir / f'firmware-{index}.json'
                 if not manifest_file.exists():
-                    self.log(f"ERROR: Individual manifest {manifest_file} not found")
+                    self.log.error(f"ERROR: Individual manifest {manifest_file} not found", file=str(manifest_file))
                     return False
                 
                 # Check firmware file exists
-                firmware_path = Path(build['parts'][0]['path'])
+                firmware_path = self.output_dir / relative_path
                 if not firmware_path.exists():
-                    self.log(f"ERROR: Firmware file not found: {firmware_path}")
+                    self.log.error(f"ERROR: Firmware file not found: {firmware_path}", file=str(firmware_path))
+                    return False
+            
+            # Validate main manifest content
+            with open(self.manifest_path) as f:
+                manifest_builds = len(json.load(f)['builds'])
+                
+            if manifest_builds != build_count:
+                self.log.error(f"ERROR: Main manifest has {manifest_builds} builds but expected {build_count}")
+                return False
+            
+            # A stale digest would keep browsers on a cached catalog
+            digest_path = self.output_dir / CATALOG_DIGEST
+            if digest_path.exists():
+                with open(digest_path) as f:
+                    published = json.load(f).get('sha256')
+                if published != FirmwareCatalog.file_sha256(self.manifest_path):
+                    self.log.error(f"ERROR: {CATALOG_DIGEST} does not match manifest.json; rerun the automation")
                     return False
             
             # Check for orphaned manifest files
-            all_manifests = list(Path('.').glob('firmware-*.json'))
-            expected_manifests = [Path(f'firmware-{i}.json') for i in range(len(builds))]
+            manifest_count = 0
+            orphaned_manifests = []
+            for manifest_file in self.output_dir.glob('firmware-*.json'):
+                manifest_count += 1
+                index = manifest_file.stem[len('firmware-'):]
+                if not index.isdigit() or int(index) >= build_count or manifest_file.name != f'firmware-{int(index)}.json':
+                    orphaned_manifests.append(manifest_file)
             
-            orphaned_manifests = set(all_manifests) - set(expected_manifests)
             if orphaned_manifests:
-                self.log(f"ERROR: Found {len(orphaned_manifests)} orphaned manifest files:")
+                self.log.error(f"ERROR: Found {len(orphaned_manifests)} orphaned manifest files:")
                 for orphaned in orphaned_manifests:
-                    self.log(f"  - {orphaned}")
+                    self.log.error(f"  - {orphaned}", file=str(orphaned))
                 return False
             
             # Verify perfect synchronization
-            firmware_count = len(list(self.firmware_dir.rglob('*.bin')))
-            manifest_count = len(all_manifests)
-            build_count = len(builds)
+            firmware_count = sum(1 for path in (self.output_dir / self.firmware_dir).rglob('*.bin')
+                                 if path.relative_to(self.output_dir) not in self.pending_archive)
             
             if firmware_count != manifest_count or firmware_count != build_count:
-                self.log(f"ERROR: Synchronization mismatch - Firmware: {firmware_count}, Manifests: {manifest_count}, Builds: {build_count}")
+                self.log.error(f"ERROR: Synchronization mismatch - Firmware: {firmware_count}, Manifests: {manifest_count}, Builds: {build_count}")
                 return False
             
             self.log("✓ All deployment files validated")
@@ -468,57 +1128,318 @@ class GitHubPagesAutomation:
             return True
             
         except Exception as e:
-            self.log(f"ERROR: Validation failed: {e}")
+            self.log.error(f"ERROR: Validation failed: {e}")
             return False
     
-    def run_complete_automation(self) -> bool:
-        """Run complete automation workflow with guaranteed clean state."""
+    def apply_retention(self) -> bool:
+        """Plan moving all but the newest `retain` versions per lineage and channel into the archive.
+        
+        Binaries and their release notes keep their Model/Variant layout below
+        archive/, where the archive manifest picks them up. Nothing is moved
+        here: the run publishes the planned builds as archived and
+        finalize_run() moves the files once it has succeeded.
+        """
+        lineages = {}
+        for bin_file, metadata in self.discover_firmware():
+            variant = f"{metadata['variant']}-{metadata['sensor_addon']}" if metadata.get('sensor_addon') else metadata['variant']
+            lineages.setdefault((metadata['model'], variant, metadata['channel']), []).append((bin_file, metadata))
+        
+        self.pending_archive = {}
+        for (model, variant, channel), entries in sorted(lineages.items()):
+            entries.sort(key=lambda entry: version_sort_key(entry[1]['version']), reverse=True)
+            for bin_file, metadata in entries[self.retain:]:
+                self.pending_archive[bin_file] = (ARCHIVE_DIR / bin_file, metadata)
+                self.log(f"🗃️  Archiving {model} {variant} v{metadata['version']} ({channel})", event='build_archived',
+                         model=model, variant=variant, version=metadata['version'], channel=channel)
+        
+        self.log(f"✓ Retention keeps {self.retain} versions per lineage and channel; {len(self.pending_archive)} builds to archive",
+                 event='retention_applied', retain=self.retain, archived=len(self.pending_archive))
+        return True
+    
+    def move_archived_builds(self) -> bool:
+        """Move the builds planned by apply_retention() into the archive."""
+        try:
+            for bin_file, (target, _) in self.pending_archive.items():
+                for source, destination in ((bin_file, target), (bin_file.with_suffix('.md'), target.with_suffix('.md'))):
+                    if source.exists():
+                        destination.parent.mkdir(parents=True, exist_ok=True)
+                        os.replace(source, destination)
+        except OSError as e:
+            self.log.error(f"ERROR: Failed to archive superseded builds: {e}")
+            return False
+        
+        self.log(f"✓ Moved {len(self.pending_archive)} superseded builds to {ARCHIVE_DIR}/", event='builds_archived', archived=len(self.pending_archive))
+        self.pending_archive = {}
+        return True
+    
+    def stage_site_files(self, firmware_paths) -> bool:
+        """Copy the page shell and scanned firmware into the output directory."""
+        # Real copies, not hard links: a binary overwritten in place must not
+        # change a release that is already being served
+        try:
+            for name in SITE_FILES:
+                source = Path(name)
+                if source.is_dir():
+                    shutil.copytree(source, self.output_dir / name, dirs_exist_ok=True)
+                elif source.exists():
+                    shutil.copy2(source, self.output_dir / name)
+            
+            staged = 0
+            for relative_path in firmware_paths:
+                staged += 1
+                firmware_path = Path(relative_path)
+                published = self.published_path(firmware_path)
+                for source, target in ((firmware_path, published), (firmware_path.with_suffix('.md'), published.with_suffix('.md'))):
+                    if source.exists():
+                        target = self.output_dir / target
+                        target.parent.mkdir(parents=True, exist_ok=True)
+                        shutil.copy2(source, target)
+            
+            self.log(f"✓ Staged {staged} firmware files and page shell")
+            return True
+            
+        except Exception as e:
+            self.log.error(f"ERROR: Failed to stage site files: {e}")
+            return False
+    
+    def run_staged_automation(self, publish_dir: Path, keep_releases: int = 3) -> bool:
+        """Build into a fresh release directory and atomically flip publish_dir to it.
+        
+        publish_dir is a symlink to the current release, so the web server never
+        sees a half-written site. An flock on a lock file prevents concurrent runs
+        from interleaving; the kernel drops it when the process exits, so a
+        killed run never leaves a stale lock behind.
+        """
+        publish_dir = Path(publish_dir)
+        releases_dir = publish_dir.parent / f".{publish_dir.name}.releases"
+        lock_path = publish_dir.parent / f".{publish_dir.name}.lock"
+        
+        if publish_dir.exists() and not publish_dir.is_symlink():
+            self.log.error(f"ERROR: {publish_dir} exists and is not a symlink; move it away before the first staged publish")
+            return False
+        
+        if fcntl is None:
+            self.log.error("ERROR: Staged publishing needs a POSIX system (fcntl and symlinks)")
+            return False
+        
+        releases_dir.mkdir(parents=True, exist_ok=True)
+        lock_fd = os.open(lock_path, os.O_CREAT | os.O_RDWR)
+        try:
+            fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            holder = os.read(lock_fd, 32).decode(errors='replace').strip() or 'unknown'
+            os.close(lock_fd)
+            self.log.error(f"ERROR: Another run holds {lock_path} (pid {holder})")
+            return False
+        
+        try:
+            os.ftruncate(lock_fd, 0)
+            os.write(lock_fd, str(os.getpid()).encode())
+            
+            release_dir = releases_dir / f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+            release_dir.mkdir()
+            self.output_dir = release_dir
+            self.manifest_path = release_dir / "manifest.json"
+            
+            if not self.run_complete_automation(finalize=False):
+                self.log.error(f"❌ Staged build failed; {publish_dir} left untouched")
+                shutil.rmtree(release_dir, ignore_errors=True)
+                return False
+            
+            # Atomic flip: rename a fresh symlink over the old one
+            temp_link = publish_dir.parent / f".{publish_dir.name}.tmp-{os.getpid()}"
+            os.symlink(os.path.relpath(release_dir, publish_dir.parent), temp_link)
+            os.replace(temp_link, publish_dir)
+            self.log(f"🚀 Published {release_dir.name} to {publish_dir}", event='published', release=release_dir.name)
+            if not self.finalize_run():
+                return False
+            
+            # Prune old releases, never the one just published
+            releases = sorted(d for d in releases_dir.iterdir() if d.is_dir())
+            for old_release in releases[:-max(keep_releases, 1)]:
+                if old_release != release_dir:
+                    shutil.rmtree(old_release, ignore_errors=True)
+                    self.log.count('releases_pruned', f"  ✓ Pruned old release {old_release.name}")
+            
+            self.log.summary()
+            return True
+            
+        except Exception as e:
+            self.log.error(f"ERROR: Staged publish failed: {e}")
+            self.abort_run()
+            return False
+        
+        finally:
+            # Closing the descriptor releases the lock; the file itself stays
+            os.close(lock_fd)
+    
+    def run_complete_automation(self, finalize: bool = True) -> bool:
+        """Run complete automation workflow with guaranteed clean state.
+        
+        Changes outside the generated site (the SQLite catalog and the retention
+        moves into archive/) are held back until every step has passed and are then applied by finalize_run(); with
+        finalize=False the caller applies them itself, e.g. after a staged flip.
+        """
+        try:
+            ok = self.run_automation_steps()
+        except BaseException:
+            self.abort_run()
+            raise
+        if not ok:
+            self.abort_run()
+            return False
+        return self.finalize_run() if finalize else True
+    
+    def finalize_run(self) -> bool:
+        """Apply the held-back retention moves, size history and catalog changes of a successful run."""
+        if self.pending_archive and not self.move_archived_builds():
+            self.abort_run()
+            return False
+        if self.size_history is not None:
+            try:
+                self.size_history.save()
+            except OSError as e:
+                self.log.error(f"❌ Could not save size history {self.size_history_path}: {e}")
+                self.abort_run()
+                return False
+        if self.catalog is None:
+            return True
+        try:
+            self.catalog.commit()
+            changed, removed = self.catalog_changes
+            self.log(f"✓ Catalog {self.catalog_path}: {changed} builds updated, {removed} removed", event='catalog_updated', changed=changed, removed=removed)
+            return True
+        except sqlite3.Error as e:
+            self.log.error(f"❌ Catalog commit failed: {e}")
+            return False
+        finally:
+            self.catalog.close()
+            self.catalog = None
+    
+    def abort_run(self):
+        """Discard the held-back retention moves and catalog changes of a failed run."""
+        if self.pending_archive:
+            self.log.warning(f"⚠️  Retention left {len(self.pending_archive)} superseded builds in {self.firmware_dir}/")
+            self.pending_archive = {}
+        if self.cache is not None:
+            self.cache.close()
+            self.cache = None
+        if self.catalog is not None:
+            self.catalog.close()
+            self.catalog = None
+            self.log.warning(f"⚠️  Catalog {self.catalog_path} left unchanged")
+    
+    def run_automation_steps(self) -> bool:
+        """Steps of run_complete_automation(); returns False at the first failed step."""
         self.log("=" * 60)
         self.log("STARTING CLEAN STATE AUTOMATION")
         self.log("=" * 60)
         
         # Step 1: Pre-run cleanup - Remove ALL firmware-*.json files
-        self.log("🧹 Step 1: Pre-run cleanup")
+        self.log("🧹 Step 1: Pre-run cleanup", event='step', step=1)
         if not self.clean_orphaned_manifests():
-            self.log("❌ Pre-run cleanup failed")
+            self.log.error("❌ Pre-run cleanup failed")
             return False
         
-        # Step 2: Scan firmware directory for actual .bin files
-        self.log("📦 Step 2: Scanning firmware directory")
-        builds = self.scan_firmware_directory()
-        if not builds:
-            self.log("⚠️  No firmware files found. Please add .bin files to firmware/ directory.")
-            return False
+        # Superseded builds leave the hot catalog before anything is scanned; the
+        # files themselves only move once the run has succeeded
+        if self.retain:
+            self.log(f"🗃️  Applying retention policy (keep {self.retain})", event='step', step='retention')
+            if not self.apply_retention():
+                self.log.error("❌ Retention policy failed")
+                return False
         
-        # Step 3: Create main manifest based on actual files
-        self.log("📄 Step 3: Creating main manifest")
-        if not self.create_main_manifest(builds):
-            self.log("❌ Main manifest creation failed")
+        # Step 2: Count .bin files; every later step re-walks the tree instead of
+        # holding the full file list
+        self.log("📦 Step 2: Scanning firmware directory", event='step', step=2)
+        build_count = sum(1 for _ in self.discover_firmware(report_rejected=True))
+        if not build_count:
+            self.log.error("⚠️  No firmware files found. Please add .bin files to firmware/ directory.")
             return False
+        self.archived_builds = sum(1 for _ in self.discover_firmware(report_rejected=True, root=self.archive_firmware_dir))
+        archive_manifest_path = self.output_dir / "archive-manifest.json"
+        if not self.archived_builds:
+            archive_manifest_path.unlink(missing_ok=True)
         
-        # Step 4: Create individual manifests for each firmware
-        self.log("📋 Step 4: Creating individual manifests")
-        if not self.create_individual_manifests(builds):
-            self.log("❌ Individual manifest creation failed")
+        # Staged runs need the page shell and binaries next to the manifests
+        if self.output_dir.resolve() != Path('.').resolve():
+            self.log(f"📂 Staging site files into {self.output_dir}")
+            if not self.stage_site_files(itertools.chain(self.iter_firmware_paths(),
+                                                         self.iter_firmware_paths(self.archive_firmware_dir))):
+                self.log.error("❌ Staging site files failed")
+                return False
+        
+        # Steps 3-4: Stream builds through parse -> enrich -> write, staging the
+        # SQLite build catalog update in the same pass if one was requested; it
+        # is only committed once the whole run has succeeded
+        self.log("📄 Step 3: Streaming main and individual manifests", event='step', step=3)
+        self.size_history = FirmwareSizeHistory(self.size_history_path) if self.size_history_path else None
+        self.cache = FirmwareCache(self.cache_path, self.firmware_dir) if self.cache_path else None
+        if self.cache is not None:
+            self.log(f"♻️  Change detection: {self.cache.tracked_files} tracked files keyed by git blob ID, "
+                     f"{self.cache.cached_files} cached", event='cache_loaded', git_files=self.cache.tracked_files, cached=self.cache.cached_files)
+        written = self.track_sizes(self.track_precache_candidates(self.write_manifests(self.iter_builds(self.discover_firmware()))))
+        if self.archived_builds:
+            # Archived builds stream after the hot ones into their own on-demand manifest
+            archived = self.iter_builds(self.discover_firmware(root=self.archive_firmware_dir))
+            written = itertools.chain(written, self.track_sizes(self.write_manifests(archived, archive_manifest_path, 'archive-firmware')))
+        try:
+            if self.catalog_path:
+                self.log("🗄️  Step 4: Updating build catalog", event='step', step=4)
+                self.catalog = FirmwareCatalog(self.catalog_path)
+                self.catalog_changes = self.catalog.update(written, resolve=self.source_path)
+            else:
+                for _ in written:
+                    pass
+        except sqlite3.Error as e:
+            self.log.error(f"❌ Catalog update failed: {e}")
+            return False
+        except Exception as e:
+            self.log.error(f"❌ Manifest creation failed: {e}")
             return False
         
+        if self.cache is not None:
+            try:
+                self.cache.save()
+            except (OSError, sqlite3.Error) as e:
+                self.log.warning(f"⚠️  Could not save cache {self.cache_path}: {e}")
+            finally:
+                self.cache.close()
+                self.cache = None
+        
         # Step 5: Validate complete deployment
-        self.log("✅ Step 5: Validating deployment")
-        if not self.validate_deployment(builds):
-            self.log("❌ Deployment validation failed")
+        self.log("✅ Step 5: Validating deployment", event='step', step=5)
+        if not self.validate_deployment(self.iter_firmware_paths()):
+            self.log.error("❌ Deployment validation failed")
+            return False
+        
+        # Step 6: Compare each lineage's latest build with its predecessor
+        if self.size_history is not None:
+            self.log("📏 Step 6: Checking firmware size budgets", event='step', step=6)
+            if not self.check_size_budgets():
+                self.log.error("❌ Firmware size budget exceeded")
+                return False
+        
+        # Step 7: Publish the versioned precache list for the service worker
+        self.log("📥 Step 7: Writing service worker precache list", event='step', step=7)
+        if not self.write_precache_manifest():
+            self.log.error("❌ Precache list creation failed")
             return False
         
+        self.log.summary()
+        
         # Success summary
         self.log("=" * 60)
         self.log("✅ CLEAN STATE AUTOMATION COMPLETED")
         self.log("=" * 60)
         self.log(f"✓ Cleaned up orphaned manifest files")
-        self.log(f"✓ {len(builds)} firmware builds processed with accurate dates")
+        self.log(f"✓ {build_count} firmware builds processed with accurate dates")
         self.log(f"✓ Main manifest.json created")
-        self.log(f"✓ {len(builds)} individual manifests created")
+        self.log(f"✓ {build_count} individual manifests created")
         self.log("✓ All files use relative URLs for GitHub Pages")
         self.log("✓ ESP Web Tools compatibility confirmed")
         self.log("✓ Perfect synchronization between firmware/ directory and manifests")
+        self.log("✓ Service worker precache list updated for offline flashing")
         self.log("")
         self.log("CLEAN STATE GUARANTEE:")
         self.log("1. ✓ All orphaned manifest files removed")
@@ -536,31 +1457,415 @@ class GitHubPagesAutomation:
         
         return True
 
+def version_sort_key(version: str) -> str:
+    """Sortable form of a version string: numeric parts zero-padded, releases after pre-releases."""
+    version = version.lstrip('v')
+    release, _, prerelease = version.partition('-')
+    numbers = '.'.join(part.zfill(6) if part.isdigit() else part for part in release.split('.'))
+    # '~' sorts after any pre-release identifier, so 1.0.0 > 1.0.0-rc.1
+    return f"{numbers}-{prerelease}" if prerelease else f"{numbers}~"
+
+
+class FirmwareCatalog:
+    """Persistent SQLite catalog of builds, updated incrementally per build."""
+    
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS builds (
+            id INTEGER PRIMARY KEY,
+            path TEXT NOT NULL UNIQUE,
+            model TEXT NOT NULL,
+            variant TEXT NOT NULL,
+            sensor_addon TEXT,
+            version TEXT NOT NULL,
+            version_key TEXT NOT NULL,
+            channel TEXT NOT NULL,
+            chip_family TEXT NOT NULL,
+            device_type TEXT,
+            description TEXT,
+            build_date TEXT,
+            file_size INTEGER,
+            content_hash TEXT,
+            mtime_ns INTEGER,
+            record_hash TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_builds_model ON builds(model, version_key);
+        CREATE INDEX IF NOT EXISTS idx_builds_variant ON builds(variant);
+        CREATE INDEX IF NOT EXISTS idx_builds_version ON builds(version_key);
+        CREATE INDEX IF NOT EXISTS idx_builds_channel ON builds(channel);
+        CREATE INDEX IF NOT EXISTS idx_builds_chip_family ON builds(chip_family);
+        CREATE INDEX IF NOT EXISTS idx_builds_content_hash ON builds(content_hash);
+        
+        CREATE TABLE IF NOT EXISTS build_addons (
+            build_id INTEGER NOT NULL REFERENCES builds(id) ON DELETE CASCADE,
+            addon TEXT NOT NULL COLLATE NOCASE,
+            PRIMARY KEY (build_id, addon)
+        );
+        CREATE INDEX IF NOT EXISTS idx_build_addons_addon ON build_addons(addon);
+        
+        CREATE TABLE IF NOT EXISTS build_sensors (
+            build_id INTEGER NOT NULL REFERENCES builds(id) ON DELETE CASCADE,
+            kind TEXT NOT NULL,
+            sensor TEXT NOT NULL COLLATE NOCASE,
+            PRIMARY KEY (build_id, kind, sensor)
+        );
+        CREATE INDEX IF NOT EXISTS idx_build_sensors_sensor ON build_sensors(sensor);
+        
+        CREATE TABLE IF NOT EXISTS build_notes (
+            build_id INTEGER NOT NULL REFERENCES builds(id) ON DELETE CASCADE,
+            section TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            text TEXT NOT NULL,
+            PRIMARY KEY (build_id, section, position)
+        );
+    """
+    
+    # Release notes sections stored in build_notes, keyed by manifest field
+    NOTE_SECTIONS = ['features', 'hardware_requirements', 'known_issues', 'changelog']
+    
+    def __init__(self, db_path: Path):
+        self.db_path = Path(db_path)
+        self.conn = sqlite3.connect(self.db_path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA foreign_keys = ON")
+        self.conn.executescript(self.SCHEMA)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.conn.close()
+    
+    def commit(self):
+        self.conn.commit()
+    
+    def close(self):
+        """Close the database; changes not yet committed are rolled back."""
+        self.conn.close()
+    
+    @staticmethod
+    def file_sha256(path: Path) -> str:
+        """Hash a file in fixed-size chunks."""
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 16), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+    
+    def update(self, builds, resolve=Path) -> tuple:
+        """Upsert changed builds and drop vanished ones. Returns (changed, removed).
+        
+        The changes stay in an open transaction until commit() is called.
+        resolve maps a published part path to the file to read it from.
+        """
+        existing = {
+            row['path']: row for row in
+            self.conn.execute("SELECT id, path, record_hash, content_hash, file_size, mtime_ns FROM builds")
+        }
+        changed = 0
+        
+        for build in builds:
+            path = build['parts'][0]['path']
+            record_hash = hashlib.sha256(json.dumps(build, sort_keys=True).encode()).hexdigest()
+            stat = resolve(path).stat()
+            row = existing.pop(path, None)
+            
+            if row and row['record_hash'] == record_hash and row['mtime_ns'] == stat.st_mtime_ns:
+                continue
+            
+            # Reuse the hash computed for the manifest; otherwise only rehash
+            # the binary when its size or mtime moved
+            if build['parts'][0].get('sha256'):
+                content_hash = build['parts'][0]['sha256']
+            elif row and row['file_size'] == stat.st_size and row['mtime_ns'] == stat.st_mtime_ns:
+                content_hash = row['content_hash']
+            else:
+                content_hash = self.file_sha256(resolve(path))
+            
+            values = (
+                path, build['model'], build['variant'], build.get('sensor_addon'),
+                build['version'], version_sort_key(build['version']), build['channel'],
+                build['chipFamily'], build.get('device_type'), build.get('description'),
+                build.get('build_date'), stat.st_size, content_hash, stat.st_mtime_ns, record_hash
+            )
+            if row:
+                build_id = row['id']
+                self.conn.execute("""
+                    UPDATE builds SET path=?, model=?, variant=?, sensor_addon=?, version=?, version_key=?,
+                        channel=?, chip_family=?, device_type=?, description=?, build_date=?,
+                        file_size=?, content_hash=?, mtime_ns=?, record_hash=?
+                    WHERE id=?""", values + (build_id,))
+                for table in ('build_addons', 'build_sensors', 'build_notes'):
+                    self.conn.execute(f"DELETE FROM {table} WHERE build_id=?", (build_id,))
+            else:
+                build_id = self.conn.execute("""
+                    INSERT INTO builds (path, model, variant, sensor_addon, version, version_key,
+                        channel, chip_family, device_type, description, build_date,
+                        file_size, content_hash, mtime_ns, record_hash)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""", values).lastrowid
+            
+            addons = build['sensor_addon'].split('-') if build.get('sensor_addon') else []
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO build_addons (build_id, addon) VALUES (?, ?)",
+                [(build_id, addon) for addon in addons])
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO build_sensors (build_id, kind, sensor) VALUES (?, ?, ?)",
+                [(build_id, 'builtin', s) for s in build.get('builtin_sensors', [])] +
+                [(build_id, 'addon', s) for s in build.get('addon_sensors', [])])
+            self.conn.executemany(
+                "INSERT INTO build_notes (build_id, section, position, text) VALUES (?, ?, ?, ?)",
+                [(build_id, section, position, text)
+                 for section in self.NOTE_SECTIONS
+                 for position, text in enumerate(build.get(section, []))])
+            changed += 1
+        
+        for row in existing.values():
+            self.conn.execute("DELETE FROM builds WHERE id=?", (row['id'],))
+        
+        return changed, len(existing)
+    
+    def query(self, model: str = None, variant: str = None, addon: str = None, version: str = None,
+              channel: str = None, chip_family: str = None, content_hash: str = None,
+              latest: bool = False) -> list:
+        """Return matching builds as dicts; latest=True keeps only the newest version per model."""
+        conditions, params = [], []
+        for column, value in (('model', model), ('variant', variant), ('version', version),
+                              ('channel', channel), ('chip_family', chip_family),
+                              ('content_hash', content_hash)):
+            if value:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+        if addon:
+            # Match either a filename addon token (sen55) or a release-notes addon sensor (Sen55x)
+            conditions.append("""(id IN (SELECT build_id FROM build_addons WHERE addon = ?)
+                OR id IN (SELECT build_id FROM build_sensors WHERE kind = 'addon' AND sensor = ?))""")
+            params.extend([addon, addon])
+        
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        if latest:
+            sql = f"""
+                SELECT * FROM (
+                    SELECT *, ROW_NUMBER() OVER (PARTITION BY model ORDER BY version_key DESC, variant) AS rank
+                    FROM builds {where}
+                ) WHERE rank = 1 ORDER BY model"""
+        else:
+            sql = f"SELECT * FROM builds {where} ORDER BY model, variant, version_key"
+        
+        results = []
+        for row in self.conn.execute(sql, params):
+            build = {key: row[key] for key in row.keys() if key not in ('rank', 'record_hash', 'mtime_ns', 'version_key')}
+            build['addons'] = [r[0] for r in self.conn.execute(
+                "SELECT addon FROM build_addons WHERE build_id=? ORDER BY addon", (row['id'],))]
+            for kind in ('builtin', 'addon'):
+                build[f'{kind}_sensors'] = [r[0] for r in self.conn.execute(
+                    "SELECT sensor FROM build_sensors WHERE build_id=? AND kind=? ORDER BY sensor", (row['id'], kind))]
+            for section in self.NOTE_SECTIONS:
+                build[section] = [r[0] for r in self.conn.execute(
+                    "SELECT text FROM build_notes WHERE build_id=? AND section=? ORDER BY position", (row['id'], section))]
+            results.append(build)
+        return results
+
+
+class FirmwareSizeHistory:
+    """Per-lineage firmware size history with ESP image segment breakdown.
+    
+    A lineage is one model, variant (including addons) and channel. Entries are
+    keyed by version and remember the binary's SHA-256, so only new or rebuilt
+    binaries have their image headers parsed on later runs. Versions whose
+    binary is gone stay on record but are never compared again.
+    """
+    
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.data = {'lineages': {}}
+        if self.path.exists():
+            with open(self.path) as f:
+                self.data = json.load(f)
+        self.seen = {}
+    
+    @staticmethod
+    def lineage_key(build: dict) -> str:
+        return f"{build['model']}/{build['variant']}/{build['channel']}"
+    
+    def record(self, build: dict, inspect_image=parse_esp_image) -> bool:
+        """Add or refresh a build's entry; returns True if its image was parsed."""
+        key = self.lineage_key(build)
+        self.seen.setdefault(key, set()).add(build['version'])
+        part = build['parts'][0]
+        versions = self.data['lineages'].setdefault(key, {})
+        entry = versions.get(build['version'])
+        if entry and entry['sha256'] == part['sha256']:
+            return False
+        
+        image = inspect_image(Path(part['path'])) or {}
+        versions[build['version']] = {
+            'size': part['size'],
+            'sha256': part['sha256'],
+            'app_size': image.get('app_size'),
+            'partition_size': image.get('partition_size'),
+            'segments': image.get('segments', {})
+        }
+        return True
+    
+    def save(self):
+        temp_path = self.path.with_name(self.path.name + '.tmp')
+        with open(temp_path, 'w') as f:
+            json.dump(self.data, f, indent=2, sort_keys=True)
+        os.replace(temp_path, self.path)
+    
+    def check(self, budgets: dict) -> list:
+        """Compare the latest version of every lineage seen this run with its predecessor.
+        
+        Only versions recorded this run take part, so a deleted build neither
+        keeps failing the check nor serves as the baseline.
+        
+        budgets holds a 'default' rule set and per-lineage overrides under
+        'lineages'; rules are max_size (bytes) and max_growth_percent. Returns one
+        report dict per lineage, with 'violations' listing exceeded budgets.
+        """
+        reports = []
+        for key in sorted(self.seen):
+            versions = self.data['lineages'][key]
+            ordered = sorted(self.seen[key], key=version_sort_key)
+            latest = versions[ordered[-1]]
+            previous = versions[ordered[-2]] if len(ordered) > 1 else None
+            rules = {**budgets.get('default', {}), **budgets.get('lineages', {}).get(key, {})}
+            
+            report = {'lineage': key, 'version': ordered[-1], 'size': latest['size'], 'violations': []}
+            if previous:
+                growth = latest['size'] - previous['size']
+                report.update({
+                    'previous_version': ordered[-2],
+                    'growth': growth,
+                    'growth_percent': growth * 100 / previous['size'] if previous['size'] else 0.0,
+                    'segment_growth': {
+                        region: latest['segments'].get(region, 0) - previous['segments'].get(region, 0)
+                        for region in sorted(set(latest['segments']) | set(previous['segments']))
+                    }
+                })
+                max_growth = rules.get('max_growth_percent')
+                if max_growth is not None and report['growth_percent'] > max_growth:
+                    report['violations'].append(
+                        f"grew {report['growth_percent']:.2f}% since v{ordered[-2]} (budget {max_growth}%)")
+            
+            max_size = rules.get('max_size')
+            if max_size is not None and latest['size'] > max_size:
+                report['violations'].append(f"{latest['size']} bytes exceeds budget of {max_size} bytes")
+            if latest.get('partition_size') and latest.get('app_size') and latest['app_size'] > latest['partition_size']:
+                report['violations'].append(
+                    f"app image of {latest['app_size']} bytes does not fit its {latest['partition_size']} byte partition")
+            reports.append(report)
+        return reports
+
+
+def run_catalog_query(args) -> int:
+    """Handle the `query` subcommand."""
+    catalog_path = Path(args.catalog or 'firmware-catalog.db')
+    if not catalog_path.exists():
+        print(f"✗ Catalog {catalog_path} not found; run with --catalog first")
+        return 1
+    
+    chip_family = args.chip
+    if chip_family:
+        chip_family = GitHubPagesAutomation().get_chip_family_mapping(chip_family.upper())
+    
+    with FirmwareCatalog(catalog_path) as catalog:
+        builds = catalog.query(model=args.model, variant=args.variant, addon=args.addon,
+                               version=args.version, channel=args.channel, chip_family=chip_family,
+                               content_hash=args.hash, latest=args.latest)
+    
+    if args.json:
+        print(json.dumps(builds, indent=2))
+    else:
+        for build in builds:
+            print(f"{build['model']:<16} {build['variant']:<28} v{build['version']:<10} "
+                  f"{build['channel']:<8} {build['chip_family']:<10} {build['path']}")
+        print(f"{len(builds)} builds")
+    return 0
+
+
 def main():
     parser = argparse.ArgumentParser(description='GitHub Pages deployment automation')
     parser.add_argument('--local', action='store_true', help='Use localhost URLs for development')
     parser.add_argument('--validate', action='store_true', help='Validate existing deployment')
+    parser.add_argument('--publish-dir', help='Build in a staging directory, validate it, then atomically publish to this symlink')
+    parser.add_argument('--keep-releases', type=int, default=3, help='Staged releases to keep next to --publish-dir (default: 3)')
+    parser.add_argument('--catalog', help='Update this SQLite build catalog after a successful run')
+    parser.add_argument('--channels', default=','.join(DEFAULT_CHANNELS), help=f'Comma-separated release channels accepted in filenames (default: {",".join(DEFAULT_CHANNELS)})')
+    parser.add_argument('--addon-tokens', help='Comma-separated addon tokens accepted in filenames (default: any lowercase token)')
+    verbosity = parser.add_mutually_exclusive_group()
+    verbosity.add_argument('--quiet', action='store_true', help='Only log warnings and errors')
+    verbosity.add_argument('--verbose', action='store_true', help='Log every per-file event instead of aggregated counters')
+    parser.add_argument('--log-format', choices=['text', 'jsonl'], default='text', help='Log as human-readable text or JSON lines (default: text)')
+    parser.add_argument('--retain', type=int, help='Keep only the newest N versions per lineage and channel in manifest.json; move older builds to archive/')
+    parser.add_argument('--size-history', help='Track per-lineage firmware sizes in this JSON history and enforce size budgets')
+    parser.add_argument('--size-budgets', default='size-budgets.json', help='Per-lineage size budgets used with --size-history (default: size-budgets.json)')
+    parser.add_argument('--max-growth-pct', type=float, help='Override the default maximum size growth per version, in percent')
+    parser.add_argument('--cache', default='.firmware-cache.db', help='SQLite cache of parsed notes, hashes and image headers keyed by git blob ID (default: .firmware-cache.db)')
+    parser.add_argument('--no-cache', action='store_true', help='Re-read every firmware file instead of using the cache')
+    parser.add_argument('--precache', choices=PRECACHE_POLICIES, default='latest-stable', help='Binaries the service worker precaches for offline flashing (default: latest-stable per model and variant)')
+    
+    subparsers = parser.add_subparsers(dest='command')
+    query_parser = subparsers.add_parser('query', help='Query the SQLite build catalog')
+    # SUPPRESS keeps the subcommand from overwriting a top-level --catalog
+    query_parser.add_argument('--catalog', default=argparse.SUPPRESS, help='Catalog database (default: firmware-catalog.db)')
+    query_parser.add_argument('--model', help='Model, e.g. Sense360-MS')
+    query_parser.add_argument('--variant', help='Variant display name, e.g. Standard-sen55-hlk2450')
+    query_parser.add_argument('--addon', help='Addon token or addon sensor, e.g. sen55 (case-insensitive)')
+    query_parser.add_argument('--version', help='Exact version, e.g. 1.0.0')
+    query_parser.add_argument('--channel', help='Release channel, e.g. stable')
+    query_parser.add_argument('--chip', help='Chip family, e.g. ESP32-S3 or ESP32S3')
+    query_parser.add_argument('--hash', help='SHA-256 content hash of the binary')
+    query_parser.add_argument('--latest', action='store_true', help='Only the latest matching build per model')
+    query_parser.add_argument('--json', action='store_true', help='Print full records as JSON')
     
     args = parser.parse_args()
     
-    automation = GitHubPagesAutomation(local_mode=args.local)
+    if args.command == 'query':
+        return run_catalog_query(args)
+    if args.retain is not None and args.retain < 1:
+        parser.error('--retain must be at least 1')
     
-    if args.validate:
-        # For validation, we need to scan first
-        builds = automation.scan_firmware_directory()
-        if automation.validate_deployment(builds):
-            print("✓ Deployment validation passed")
-            return 0
-        else:
-            print("✗ Deployment validation failed")
-            return 1
-    else:
-        if automation.run_complete_automation():
-            print("✓ Automation completed successfully")
-            return 0
+    verbosity = 'quiet' if args.quiet else 'verbose' if args.verbose else 'normal'
+    logger = AutomationLogger(verbosity=verbosity, log_format=args.log_format)
+    automation = GitHubPagesAutomation(
+        local_mode=args.local,
+        catalog_path=args.catalog,
+        channels=args.channels.split(','),
+        addon_tokens=args.addon_tokens.split(',') if args.addon_tokens else None,
+        logger=logger,
+        precache_policy=args.precache,
+        size_history_path=args.size_history,
+        size_budgets_path=args.size_budgets,
+        max_growth_percent=args.max_growth_pct,
+        cache_path=None if args.no_cache else args.cache,
+        retain=args.retain
+    )
+    
+    try:
+        if args.publish_dir:
+            if automation.run_staged_automation(Path(args.publish_dir), args.keep_releases):
+                logger("✓ Staged publish completed successfully", event='result', ok=True)
+                return 0
+            else:
+                logger.error("✗ Staged publish failed", event='result', ok=False)
+                return 1
+        elif args.validate:
+            # Validation only needs the discovered paths, not parsed release notes
+            if automation.validate_deployment(automation.iter_firmware_paths()):
+                logger("✓ Deployment validation passed", event='result', ok=True)
+                return 0
+            else:
+                logger.error("✗ Deployment validation failed", event='result', ok=False)
+                return 1
         else:
-            print("✗ Automation failed")
-            return 1
+            if automation.run_complete_automation():
+                logger("✓ Automation completed successfully", event='result', ok=True)
+                return 0
+            else:
+                logger.error("✗ Automation failed", event='result', ok=False)
+                return 1
+    finally:
+        logger.flush()
 
 if __name__ == '__main__':
     exit(main())
\ No newline at end of file
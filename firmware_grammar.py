@@ -0,0 +1,110 @@
+"""
+Firmware Filename Grammar
+=========================
+
+Single source of truth for the firmware naming scheme:
+
+  firmware/{Model}/{Variant}/{Model}-{Variant}[-{addon}...]-v{Version}-{Channel}.{bin|md}
+
+  {addon}    any number of lowercase tokens, e.g. sen55-hlk2450
+  {Version}  semver with optional pre-release, e.g. 1.2.0 or 1.3.0-rc.1
+  {Channel}  one of the configured release channels
+
+The grammar compiles to one regular expression, so classifying a path is a
+single match call. Rejected paths are explained on demand, off the hot path.
+
+Usage:
+  from firmware_grammar import FilenameGrammar
+  grammar = FilenameGrammar()
+  metadata, reason = grammar.classify("firmware/Sense360-MS/Standard/Sense360-MS-Standard-v1.0.0-stable.bin")
+"""
+
+import re
+
+DEFAULT_CHANNELS = ('stable', 'beta', 'alpha', 'dev', 'rc', 'nightly')
+DEFAULT_ADDON_TOKEN = r'[a-z0-9]+'
+DEFAULT_EXTENSIONS = ('bin', 'md')
+
+# Plain quantifiers only: possessive ones would need Python 3.11+
+VERSION_PATTERN = r'\d+\.\d+\.\d+(?:-[0-9A-Za-z]+(?:[.-][0-9A-Za-z]+)*)?'
+
+
+class FilenameGrammar:
+    """Compiled matcher for firmware paths and filenames."""
+
+    def __init__(self, channels=DEFAULT_CHANNELS, addon_tokens=None, extensions=DEFAULT_EXTENSIONS):
+        """
+        channels:     accepted release channels
+        addon_tokens: allowed addon tokens, or None to accept any lowercase token
+        extensions:   accepted file extensions, without the dot
+        """
+        self.channels = tuple(channels)
+        self.addon_tokens = tuple(addon_tokens) if addon_tokens else None
+        self.extensions = tuple(extensions)
+
+        addon = '|'.join(map(re.escape, self.addon_tokens)) if self.addon_tokens else DEFAULT_ADDON_TOKEN
+        # Leading directories are skipped one component at a time; addon tokens
+        # must be followed by another '-', so '-v1.0.0' is never taken as an addon
+        self.pattern = re.compile(
+            r'(?:[^/]*/)*?(?P<model>[^/]+)/(?P<variant>[^/]+)/'
+            r'(?P=model)-(?P=variant)'
+            rf'(?P<addons>(?:-(?:{addon})(?=-))*)'
+            rf'-v(?P<version>{VERSION_PATTERN})'
+            rf'-(?P<channel>{"|".join(map(re.escape, self.channels))})'
+            rf'\.(?P<extension>{"|".join(map(re.escape, self.extensions))})'
+        )
+        self._addon_pattern = re.compile(rf'(?:{addon})')
+        self._version_pattern = re.compile(rf'-v({VERSION_PATTERN})-([^.]+)$')
+
+    def match(self, path: str) -> dict:
+        """Return metadata for a '/'-separated path, or None if it does not follow the grammar."""
+        m = self.pattern.fullmatch(path)
+        if m is None:
+            return None
+        model, variant, addons, version, channel, extension = m.groups()
+        return {
+            'model': model,
+            'variant': variant,
+            'sensor_addon': addons[1:] or None,
+            'addons': addons[1:].split('-') if addons else [],
+            'version': version,
+            'channel': channel,
+            'extension': extension,
+        }
+
+    def classify(self, path: str) -> tuple:
+        """Return (metadata, None) for accepted paths or (None, reason) for rejected ones."""
+        metadata = self.match(path)
+        if metadata is not None:
+            return metadata, None
+        return None, self.explain(path)
+
+    def explain(self, path: str) -> str:
+        """Describe why a path does not follow the grammar."""
+        parts = path.split('/')
+        if len(parts) < 3:
+            return "expected firmware/<Model>/<Variant>/<filename>"
+
+        model, variant, filename = parts[-3], parts[-2], parts[-1]
+        stem, dot, extension = filename.rpartition('.')
+        if not dot or extension not in self.extensions:
+            return f"unsupported extension '.{extension}' (expected {', '.join('.' + e for e in self.extensions)})"
+
+        prefix = f"{model}-{variant}"
+        if not stem.startswith(prefix + '-'):
+            return f"filename does not start with '{prefix}-' from its Model/Variant directories"
+
+        version_match = self._version_pattern.search(stem)
+        if version_match is None:
+            return "missing or malformed version (expected -v<major>.<minor>.<patch>[-<pre-release>]-<channel>)"
+
+        channel = version_match.group(2)
+        if channel not in self.channels:
+            return f"unknown channel '{channel}' (expected one of {', '.join(self.channels)})"
+
+        addons = stem[len(prefix):version_match.start()]
+        bad_tokens = [token for token in addons.split('-')[1:] if not self._addon_pattern.fullmatch(token)]
+        if bad_tokens:
+            return f"invalid addon token(s): {', '.join(bad_tokens)}"
+
+        return "does not match the firmware naming grammar"
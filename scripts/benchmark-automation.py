@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Deployment Automation Benchmark
+===============================
+
+Generates synthetic firmware catalogs of increasing size in a temporary
+directory and runs the deploy-automation.py manifest pipeline against them in
+its default configuration, change-detection cache included, reporting wall
+time, throughput and peak Python memory per catalog size. Each size is run
+twice: cold (empty cache) and warm (every file cached). Catalogs are committed
+to a throwaway git repository when git is available, so the cache is keyed by
+blob ID as in a real checkout. Also measures filename grammar classification
+throughput.
+
+Usage:
+  python3 scripts/benchmark-automation.py
+  python3 scripts/benchmark-automation.py --sizes 1000,10000,50000
+  python3 scripts/benchmark-automation.py --sizes '' --classify 1000000
+"""
+
+import argparse
+import importlib.util
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+from firmware_grammar import FilenameGrammar
+
+RELEASE_NOTES_TEMPLATE = """# {model} {variant} v{version} {channel}
+
+## Device Information
+Model: {model}
+Device Type: Benchmark Device
+Variant: {variant}
+Built-in Sensors: LTR303, SCD40, SHT30
+Addon Sensors: {addons}
+Chip Family: ESP32-S3
+Release Date: 2025-07-13
+
+## Release Description
+Synthetic release used by the automation benchmark
+
+## Features
+- Feature one
+- Feature two
+
+## Changelog
+- Synthetic build
+"""
+
+
+def load_automation_module():
+    """Import deploy-automation.py, whose hyphenated name rules out a plain import."""
+    spec = importlib.util.spec_from_file_location("deploy_automation", REPO_ROOT / "deploy-automation.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def generate_catalog(root: Path, size: int):
+    """Create `size` tiny firmware binaries with release notes under root/firmware."""
+    models_count = max(1, size // 500)
+    for index in range(size):
+        model = f"Sense360-B{index % models_count}"
+        variant = "Standard"
+        addon = "sen55-hlk2450" if index % 2 else None
+        version = f"{index // 1000}.{(index // 10) % 100}.{index % 10}"
+        channel = "stable" if index % 3 else "beta"
+
+        directory = root / "firmware" / model / variant
+        directory.mkdir(parents=True, exist_ok=True)
+        stem = f"{model}-{variant}-{addon + '-' if addon else ''}v{version}-{channel}"
+        (directory / f"{stem}.bin").write_bytes(b"\xe9" + bytes(255))
+        (directory / f"{stem}.md").write_text(RELEASE_NOTES_TEMPLATE.format(
+            model=model, variant=variant, version=version, channel=channel,
+            addons="Sen55x, HLK2450" if addon else "None"))
+
+
+def commit_catalog(root: Path):
+    """Commit the generated catalog so files are keyed by git blob ID; skipped without git."""
+    try:
+        for command in (['git', 'init', '-q'], ['git', 'add', 'firmware'],
+                        ['git', '-c', 'user.name=benchmark', '-c', 'user.email=benchmark@localhost',
+                         'commit', '-q', '--no-gpg-sign', '-m', 'Benchmark catalog']):
+            subprocess.run(command, cwd=root, check=True, capture_output=True)
+    except (FileNotFoundError, subprocess.CalledProcessError):
+        pass
+
+
+def run_pipeline(module, root: Path) -> dict:
+    """Run discover -> parse -> enrich -> write with the default cache and measure time and peak memory."""
+    automation = module.GitHubPagesAutomation(output_dir=root, logger=module.AutomationLogger(verbosity='quiet'),
+                                              cache_path=Path('.firmware-cache.db'))
+    automation.firmware_dir = Path("firmware")
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    automation.cache = module.FirmwareCache(automation.cache_path, automation.firmware_dir)
+    entries = automation.discover_firmware()
+    count = 0
+    for _ in automation.write_manifests(automation.iter_builds(entries)):
+        count += 1
+    automation.cache.save()
+    automation.cache.close()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'builds': count,
+        'seconds': elapsed,
+        'peak_bytes': peak,
+        'manifest_bytes': (root / "manifest.json").stat().st_size,
+    }
+
+
+def generate_paths(count: int) -> list:
+    """Synthetic firmware paths, one in ten of them malformed."""
+    paths = []
+    for index in range(count):
+        model = f"Sense360-M{index % 40}"
+        variant = ("Standard", "Pro", "Mini")[index % 3]
+        addons = ("", "-sen55", "-sen55-hlk2450", "-ld2410s-bmp390-sfa40")[index % 4]
+        version = f"{index % 7}.{index % 13}.{index % 17}" + ("-rc.1" if index % 5 == 0 else "")
+        channel = ("stable", "beta", "nightly")[index % 3]
+        if index % 10 == 9:
+            channel = "unreleased"
+        paths.append(f"firmware/{model}/{variant}/{model}-{variant}{addons}-v{version}-{channel}.bin")
+    return paths
+
+
+def run_classification(count: int) -> dict:
+    """Classify `count` paths with the compiled grammar and time it."""
+    grammar = FilenameGrammar()
+    paths = generate_paths(count)
+
+    start = time.perf_counter()
+    accepted = sum(1 for path in paths if grammar.match(path) is not None)
+    match_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    rejected = sum(1 for path in paths if grammar.classify(path)[1] is not None)
+    classify_seconds = time.perf_counter() - start
+
+    return {
+        'paths': count,
+        'accepted': accepted,
+        'rejected': rejected,
+        'match_rate': count / match_seconds,
+        'classify_rate': count / classify_seconds,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the deployment automation pipeline')
+    parser.add_argument('--sizes', default='500,2000,8000', help='Comma-separated catalog sizes (default: 500,2000,8000)')
+    parser.add_argument('--classify', type=int, default=200000, help='Paths for the grammar benchmark, 0 to skip (default: 200000)')
+    args = parser.parse_args()
+
+    if args.classify:
+        result = run_classification(args.classify)
+        print(f"Grammar: {result['paths']} paths, {result['accepted']} accepted, {result['rejected']} rejected")
+        print(f"  match:    {result['match_rate']:>12,.0f} paths/s")
+        print(f"  classify: {result['classify_rate']:>12,.0f} paths/s (including rejection reasons)")
+        print()
+
+    module = load_automation_module()
+    sizes = [int(size) for size in args.sizes.split(',') if size]
+    if not sizes:
+        return 0
+
+    print(f"{'builds':>8} {'cache':>6} {'seconds':>9} {'builds/s':>10} {'peak MiB':>9} {'manifest MiB':>13}")
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            root = Path(temp_dir)
+            generate_catalog(root, size)
+            commit_catalog(root)
+            previous_dir = os.getcwd()
+            os.chdir(root)
+            try:
+                results = [('cold', run_pipeline(module, Path('.'))), ('warm', run_pipeline(module, Path('.')))]
+            finally:
+                os.chdir(previous_dir)
+
+        for cache, result in results:
+            print(f"{result['builds']:>8} {cache:>6} {result['seconds']:>9.2f} {result['builds'] / result['seconds']:>10.0f} "
+                  f"{result['peak_bytes'] / 2**20:>9.2f} {result['manifest_bytes'] / 2**20:>13.2f}")
+
+    print("Peak memory covers the whole pipeline; it should stay roughly flat while the manifest grows.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Resumable Firmware Downloader
+=============================
+
+Downloads the parts listed in an individual manifest (firmware-N.json),
+verifying every fixed-size chunk against the manifest's chunk hash list as it
+arrives. An interrupted download keeps its verified prefix in a .part file and
+resumes with an HTTP range request instead of starting over.
+
+Usage:
+  python3 scripts/fetch-firmware.py http://localhost:5000/firmware-0.json
+  python3 scripts/fetch-firmware.py https://example.github.io/firmware-2.json --output-dir downloads --retries 10
+"""
+
+import argparse
+import hashlib
+import http.client
+import json
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+from urllib.parse import urljoin
+
+
+class ChunkMismatch(Exception):
+    """A downloaded chunk did not match its hash in the manifest."""
+
+
+def verify_chunk_list(part: dict) -> bool:
+    """Check the chunk hash list against its root digest."""
+    root = hashlib.sha256(b''.join(bytes.fromhex(chunk) for chunk in part['chunks']))
+    return root.hexdigest() == part['chunk_root']
+
+
+def verified_prefix(partial_path: Path, part: dict) -> int:
+    """Return how many leading bytes of a partial download match the chunk list."""
+    if not partial_path.exists():
+        return 0
+    verified = 0
+    with open(partial_path, 'rb') as f:
+        for expected in part['chunks']:
+            chunk = f.read(part['chunk_size'])
+            if not chunk or hashlib.sha256(chunk).hexdigest() != expected:
+                break
+            # A short chunk is only complete if it is the final one
+            if len(chunk) < part['chunk_size'] and verified + len(chunk) != part['size']:
+                break
+            verified += len(chunk)
+    return verified
+
+
+def download_from(url: str, partial_path: Path, part: dict, offset: int, timeout: float) -> int:
+    """Append verified chunks to partial_path starting at offset; return the new offset."""
+    request = urllib.request.Request(url, headers={'Range': f'bytes={offset}-'} if offset else {})
+    try:
+        response = urllib.request.urlopen(request, timeout=timeout)
+    except urllib.error.HTTPError as e:
+        # Nothing left to send: the verified prefix is the whole part
+        if e.code == 416 and offset == part['size']:
+            return offset
+        raise
+    with response:
+        if offset and response.status != 206:
+            # Server ignored the range; start this part over
+            print("  Server does not support range requests, restarting part")
+            offset = 0
+
+        with open(partial_path, 'r+b' if partial_path.exists() else 'wb') as f:
+            f.seek(offset)
+            f.truncate()
+            chunk_size = part['chunk_size']
+            while offset < part['size']:
+                index = offset // chunk_size
+                expected_length = min(chunk_size, part['size'] - offset)
+                chunk = response.read(expected_length)
+                while len(chunk) < expected_length:
+                    more = response.read(expected_length - len(chunk))
+                    if not more:
+                        raise urllib.error.URLError("connection closed mid-chunk")
+                    chunk += more
+                if hashlib.sha256(chunk).hexdigest() != part['chunks'][index]:
+                    raise ChunkMismatch(f"chunk {index} failed verification")
+                f.write(chunk)
+                f.flush()
+                offset += len(chunk)
+    return offset
+
+
+def fetch_part(base_url: str, part: dict, output_dir: Path, retries: int, timeout: float) -> bool:
+    """Download one manifest part with chunk verification and resume."""
+    url = urljoin(base_url, part['path'])
+    target = output_dir / Path(part['path']).name
+    partial_path = target.with_name(target.name + '.part')
+
+    if 'chunks' not in part:
+        print(f"✗ {part['path']}: manifest has no chunk hashes; regenerate it with deploy-automation.py")
+        return False
+    if not verify_chunk_list(part):
+        print(f"✗ {part['path']}: chunk list does not match chunk_root")
+        return False
+
+    offset = verified_prefix(partial_path, part)
+    if offset == part['size']:
+        # Complete but not yet renamed, e.g. after a crash before replace()
+        print(f"  {partial_path.name} is already complete")
+        with open(partial_path, 'r+b') as f:
+            f.truncate(offset)
+    elif offset:
+        print(f"  Resuming {target.name} at {offset} of {part['size']} bytes")
+
+    for attempt in range(retries + 1):
+        if offset == part['size']:
+            break
+        try:
+            offset = download_from(url, partial_path, part, offset, timeout)
+            break
+        except ChunkMismatch as e:
+            # Chunks verified before the mismatch are already on disk
+            offset = verified_prefix(partial_path, part)
+            print(f"  {e}; re-fetching from byte {offset}")
+        except (urllib.error.URLError, OSError, http.client.HTTPException) as e:
+            offset = verified_prefix(partial_path, part)
+            print(f"  Download interrupted at byte {offset}: {e}")
+        if attempt < retries:
+            time.sleep(min(2 ** attempt, 30))
+    else:
+        print(f"✗ {target.name}: giving up after {retries + 1} attempts; {offset} verified bytes kept in {partial_path}")
+        return False
+
+    digest = hashlib.sha256(partial_path.read_bytes()).hexdigest()
+    if digest != part['sha256']:
+        partial_path.unlink()
+        print(f"✗ {target.name}: full-file SHA-256 mismatch")
+        return False
+
+    partial_path.replace(target)
+    print(f"✓ {target.name}: {part['size']} bytes verified ({len(part['chunks'])} chunks)")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Download firmware parts with chunk verification and resume')
+    parser.add_argument('manifest_url', help='URL of an individual manifest, e.g. http://localhost:5000/firmware-0.json')
+    parser.add_argument('--output-dir', default='downloads', help='Where to store firmware files (default: downloads)')
+    parser.add_argument('--retries', type=int, default=5, help='Retries per part after an interruption (default: 5)')
+    parser.add_argument('--timeout', type=float, default=30, help='Socket timeout in seconds (default: 30)')
+    args = parser.parse_args()
+
+    with urllib.request.urlopen(args.manifest_url, timeout=args.timeout) as response:
+        manifest = json.load(response)
+
+    output_dir = Path(args.output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    ok = True
+    for build in manifest['builds']:
+        for part in build['parts']:
+            ok = fetch_part(args.manifest_url, part, output_dir, args.retries, args.timeout) and ok
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    exit(main())
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+Flashing Station Load Test
+==========================
+
+Simulates many browsers opening the installer at once against a local copy of
+the generated site served by scripts/serve.py. Each simulated client replays
+the page's access pattern: manifest.json, then (after a think time) the chosen
+firmware-N.json, then every binary part it lists.
+
+The same replay runs against three layouts built in a temporary directory:
+
+  raw            the site as deploy-automation.py writes it
+  precompressed  every manifest and binary also stored as .gz, sent gzip-encoded
+  sharded        manifest.json split into manifest-index.json plus one shard per
+                 model, so a client only downloads the catalog of the model it picks
+
+For every layout it reports latency percentiles per request kind and per
+session, throughput and bytes transferred.
+
+Usage:
+  python3 scripts/load-test.py                          # 50 clients against the site in .
+  python3 scripts/load-test.py --clients 100 --sessions 3 --think-time 2
+  python3 scripts/load-test.py --site site --layouts raw,precompressed
+"""
+
+import argparse
+import gzip
+import http.client
+import json
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from http.server import ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import quote, urljoin
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from serve import RangeRequestHandler
+
+LAYOUTS = ['raw', 'precompressed', 'sharded']
+
+
+class QuietHandler(RangeRequestHandler):
+    """Range handler without per-request access logging."""
+
+    def log_message(self, format, *args):
+        pass
+
+
+class LoadTestServer(ThreadingHTTPServer):
+    """Threaded server with a listen backlog large enough for a burst of clients."""
+
+    daemon_threads = True
+    request_queue_size = 256
+
+
+def copy_site(site: Path, target: Path) -> dict:
+    """Copy manifest.json, the individual manifests and the binaries they reference."""
+    with open(site / 'manifest.json') as f:
+        manifest = json.load(f)
+    shutil.copy2(site / 'manifest.json', target / 'manifest.json')
+    for index, build in enumerate(manifest['builds']):
+        shutil.copy2(site / f'firmware-{index}.json', target / f'firmware-{index}.json')
+        for part in build['parts']:
+            destination = target / part['path']
+            destination.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copy2(site / part['path'], destination)
+    return manifest
+
+
+def prepare_layout(site: Path, layout: str, target: Path):
+    """Build one layout of the site under target."""
+    manifest = copy_site(site, target)
+
+    if layout == 'precompressed':
+        for path in list(target.rglob('*')):
+            if path.is_file() and path.suffix in ('.json', '.bin'):
+                with open(path, 'rb') as source, gzip.open(path.with_name(path.name + '.gz'), 'wb', compresslevel=9) as packed:
+                    shutil.copyfileobj(source, packed)
+
+    elif layout == 'sharded':
+        shards = {}
+        for index, build in enumerate(manifest['builds']):
+            shards.setdefault(build['model'], []).append({**build, 'manifest': f'firmware-{index}.json'})
+        (target / 'manifest-shards').mkdir()
+        index = {key: value for key, value in manifest.items() if key != 'builds'}
+        index['models'] = {}
+        for model, builds in sorted(shards.items()):
+            shard_path = f'manifest-shards/{model}.json'
+            with open(target / shard_path, 'w') as f:
+                json.dump({'model': model, 'builds': builds}, f, indent=2)
+            index['models'][model] = {'manifest': shard_path, 'builds': len(builds)}
+        with open(target / 'manifest-index.json', 'w') as f:
+            json.dump(index, f, indent=2)
+
+
+class Recorder:
+    """Thread-safe collection of request and session timings."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = {}
+        self.sessions = []
+        self.errors = 0
+        self.bytes = 0
+
+    def request(self, kind: str, seconds: float, size: int):
+        with self.lock:
+            self.requests.setdefault(kind, []).append(seconds)
+            self.bytes += size
+
+    def session(self, seconds: float):
+        with self.lock:
+            self.sessions.append(seconds)
+
+    def error(self):
+        with self.lock:
+            self.errors += 1
+
+
+def fetch(url: str, kind: str, recorder: Recorder, timeout: float) -> bytes:
+    """GET url like a browser would and record latency and bytes on the wire."""
+    request = urllib.request.Request(url, headers={'Accept-Encoding': 'gzip'})
+    start = time.perf_counter()
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        body = response.read()
+        encoding = response.headers.get('Content-Encoding')
+    recorder.request(kind, time.perf_counter() - start, len(body))
+    return gzip.decompress(body) if encoding == 'gzip' else body
+
+
+def run_session(base_url: str, layout: str, rng: random.Random, think_time: float,
+                recorder: Recorder, timeout: float):
+    """One visitor: load the catalog, pick a build, then download its manifest and parts."""
+    start = time.perf_counter()
+    if layout == 'sharded':
+        index = json.loads(fetch(base_url + 'manifest-index.json', 'catalog', recorder, timeout))
+        shard = index['models'][rng.choice(sorted(index['models']))]
+        builds = json.loads(fetch(base_url + quote(shard['manifest']), 'catalog', recorder, timeout))['builds']
+        manifest_name = rng.choice(builds)['manifest']
+    else:
+        builds = json.loads(fetch(base_url + 'manifest.json', 'catalog', recorder, timeout))['builds']
+        manifest_name = f'firmware-{rng.randrange(len(builds))}.json'
+
+    # The user reads the list and chooses a build
+    time.sleep(rng.uniform(0, 2 * think_time))
+
+    manifest_url = base_url + manifest_name
+    individual = json.loads(fetch(manifest_url, 'manifest', recorder, timeout))
+    for part in individual['builds'][0]['parts']:
+        fetch(urljoin(manifest_url, quote(part['path'])), 'part', recorder, timeout)
+    recorder.session(time.perf_counter() - start)
+
+
+def run_client(base_url: str, layout: str, seed: int, args, recorder: Recorder):
+    rng = random.Random(seed)
+    time.sleep(rng.uniform(0, args.ramp_up))
+    for session in range(args.sessions):
+        if session:
+            time.sleep(rng.uniform(0, 2 * args.think_time))
+        try:
+            run_session(base_url, layout, rng, args.think_time, recorder, args.timeout)
+        except (urllib.error.URLError, http.client.HTTPException, OSError, ValueError, KeyError):
+            recorder.error()
+
+
+def run_layout(site: Path, layout: str, args) -> dict:
+    """Serve one layout from a temporary copy and replay all clients against it."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        root = Path(temp_dir)
+        prepare_layout(site, layout, root)
+
+        server = LoadTestServer(('127.0.0.1', 0), partial(QuietHandler, directory=str(root)))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = f'http://127.0.0.1:{server.server_address[1]}/'
+
+        recorder = Recorder()
+        start = time.perf_counter()
+        try:
+            with ThreadPoolExecutor(max_workers=args.clients) as pool:
+                futures = [pool.submit(run_client, base_url, layout, args.seed + client, args, recorder)
+                           for client in range(args.clients)]
+            # Failed requests are counted by run_client; anything else is a bug
+            # in the load test and must not vanish inside the pool
+            for future in futures:
+                future.result()
+        finally:
+            server.shutdown()
+            server.server_close()
+        elapsed = time.perf_counter() - start
+
+    return {'layout': layout, 'seconds': elapsed, 'recorder': recorder}
+
+
+def percentile(values: list, fraction: float) -> float:
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))]
+
+
+def format_latencies(values: list) -> str:
+    if not values:
+        return 'n/a'
+    return ' / '.join(f"{percentile(values, fraction) * 1000:.0f}" for fraction in (0.5, 0.95, 0.99)) + \
+        f" / {max(values) * 1000:.0f}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load-test the generated site with many simulated flashing clients')
+    parser.add_argument('--site', default='.', help='Directory with manifest.json, firmware-N.json and firmware/ (default: .)')
+    parser.add_argument('--clients', type=int, default=50, help='Concurrent clients (default: 50)')
+    parser.add_argument('--sessions', type=int, default=2, help='Install sessions per client (default: 2)')
+    parser.add_argument('--think-time', type=float, default=0.5, help='Mean seconds a user spends choosing a build (default: 0.5)')
+    parser.add_argument('--ramp-up', type=float, default=1.0, help='Spread client start times over this many seconds (default: 1)')
+    parser.add_argument('--layouts', default=','.join(LAYOUTS), help=f'Comma-separated layouts to compare (default: {",".join(LAYOUTS)})')
+    parser.add_argument('--timeout', type=float, default=60, help='Per-request timeout in seconds (default: 60)')
+    parser.add_argument('--seed', type=int, default=1, help='Random seed for build choices and think times (default: 1)')
+    args = parser.parse_args()
+
+    site = Path(args.site)
+    if not (site / 'manifest.json').exists():
+        print(f"✗ {site / 'manifest.json'} not found; run deploy-automation.py first")
+        return 1
+    layouts = [layout for layout in args.layouts.split(',') if layout]
+    unknown = [layout for layout in layouts if layout not in LAYOUTS]
+    if unknown:
+        print(f"✗ Unknown layouts: {', '.join(unknown)} (expected {', '.join(LAYOUTS)})")
+        return 1
+
+    print(f"{args.clients} clients x {args.sessions} sessions, think time {args.think_time}s, ramp-up {args.ramp_up}s")
+    print("Latencies in ms as p50 / p95 / p99 / max")
+    print()
+
+    for layout in layouts:
+        result = run_layout(site, layout, args)
+        recorder = result['recorder']
+        requests = sum(len(values) for values in recorder.requests.values())
+        print(f"{layout}:")
+        print(f"  sessions  {len(recorder.sessions)} completed, {recorder.errors} failed in {result['seconds']:.1f}s")
+        print(f"  requests  {requests} ({requests / result['seconds']:.1f}/s)")
+        print(f"  bytes     {recorder.bytes / 2**20:.1f} MiB ({recorder.bytes / 2**20 / result['seconds']:.1f} MiB/s)")
+        for kind in ('catalog', 'manifest', 'part'):
+            print(f"  {kind:<9} {format_latencies(recorder.requests.get(kind, []))}")
+        print(f"  session   {format_latencies(recorder.sessions)}")
+        print()
+
+    print("Session latency includes think time; compare layouts run with the same seed.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
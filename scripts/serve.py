@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Local Firmware Server
+=====================
+
+Serves the generated site for local development and flashing stations.
+Unlike `python3 -m http.server`, it answers single-range requests
+(`Range: bytes=start-end`) with 206 Partial Content, so interrupted firmware
+downloads can resume from the last verified chunk. Files with a precompressed
+`.gz` sibling are sent gzip-encoded to clients that accept it.
+
+Usage:
+  python3 scripts/serve.py                      # Serve current directory on port 5000
+  python3 scripts/serve.py --port 8080 --directory site
+"""
+
+import argparse
+import os
+import re
+from functools import partial
+from http import HTTPStatus
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+RANGE_PATTERN = re.compile(r'bytes=(\d*)-(\d*)$')
+
+
+class RangeRequestHandler(SimpleHTTPRequestHandler):
+    """Static file handler with single byte-range support and CORS headers."""
+
+    def end_headers(self):
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Accept-Ranges', 'bytes')
+        super().end_headers()
+
+    def send_head(self):
+        self.range_remaining = None
+        range_header = self.headers.get('Range')
+        path = self.translate_path(self.path)
+        if not range_header and 'gzip' in self.headers.get('Accept-Encoding', '') and os.path.isfile(path + '.gz'):
+            return self.send_precompressed(path)
+        if not range_header or os.path.isdir(path):
+            return super().send_head()
+
+        match = RANGE_PATTERN.match(range_header.strip())
+        if not match:
+            # Multi-range and malformed requests fall back to the full file
+            return super().send_head()
+
+        try:
+            f = open(path, 'rb')
+        except OSError:
+            self.send_error(HTTPStatus.NOT_FOUND, "File not found")
+            return None
+
+        size = os.fstat(f.fileno()).st_size
+        first, last = match.groups()
+        if first:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+        else:
+            # Suffix range: the last N bytes
+            start = max(size - int(last or 0), 0)
+            end = size - 1
+
+        if start >= size or start > end:
+            f.close()
+            self.send_response(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+            self.send_header('Content-Range', f'bytes */{size}')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return None
+
+        f.seek(start)
+        self.range_remaining = end - start + 1
+        self.send_response(HTTPStatus.PARTIAL_CONTENT)
+        self.send_header('Content-Type', self.guess_type(path))
+        self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        self.send_header('Content-Length', str(self.range_remaining))
+        self.end_headers()
+        return f
+
+    def send_precompressed(self, path):
+        """Answer with the .gz sibling of path, labelled with the original type."""
+        try:
+            f = open(path + '.gz', 'rb')
+        except OSError:
+            self.send_error(HTTPStatus.NOT_FOUND, "File not found")
+            return None
+        self.send_response(HTTPStatus.OK)
+        self.send_header('Content-Type', self.guess_type(path))
+        self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(os.fstat(f.fileno()).st_size))
+        self.send_header('Vary', 'Accept-Encoding')
+        self.end_headers()
+        return f
+
+    def copyfile(self, source, outputfile):
+        if self.range_remaining is None:
+            return super().copyfile(source, outputfile)
+        remaining = self.range_remaining
+        while remaining > 0:
+            block = source.read(min(64 * 1024, remaining))
+            if not block:
+                break
+            outputfile.write(block)
+            remaining -= len(block)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve the firmware site with HTTP range support')
+    parser.add_argument('--port', type=int, default=5000, help='Port to listen on (default: 5000)')
+    parser.add_argument('--bind', default='', help='Address to bind (default: all interfaces)')
+    parser.add_argument('--directory', default='.', help='Directory to serve (default: current directory)')
+    args = parser.parse_args()
+
+    handler = partial(RangeRequestHandler, directory=args.directory)
+    with ThreadingHTTPServer((args.bind, args.port), handler) as server:
+        print(f"Serving {os.path.abspath(args.directory)} on http://localhost:{args.port}/ (range requests enabled)")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            print("\nStopped")
+    return 0
+
+
+if __name__ == '__main__':
+    exit(main())
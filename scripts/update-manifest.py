@@ -4,8 +4,10 @@ Firmware Binary Management Script
 ================================
 
 Automatically scans firmware/ directory and updates manifest.json for ESP Web Tools.
-Extracts metadata from filename/directory structure following naming convention:
-  Sense360-[DeviceType]-[ChipFamily]-v[Version]-[Channel].bin
+Extracts metadata with the shared filename grammar (firmware_grammar.py):
+  firmware/[Model]/[Variant]/[Model]-[Variant][-addon...]-v[Version]-[Channel].bin
+The chip family is not part of the filename; it is read from the "Chip Family"
+field of the release notes next to each binary, and left out when unknown.
 
 Usage:
   python3 scripts/update-manifest.py
@@ -14,53 +16,57 @@ Usage:
 
 import json
 import os
+import re
+import sys
 import argparse
 from pathlib import Path
 from datetime import datetime
-import re
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from firmware_grammar import FilenameGrammar
 
 class FirmwareBinaryManager:
     def __init__(self, firmware_dir: str = "firmware", manifest_path: str = "manifest.json"):
         self.firmware_dir = Path(firmware_dir)
         self.manifest_path = Path(manifest_path)
         self.base_url = "http://localhost:5000/"
+        self.grammar = FilenameGrammar()
         
-    def extract_metadata_from_filename(self, filename: str) -> dict:
-        """Extract metadata from firmware filename following naming convention."""
-        # Pattern: Sense360-[DeviceType]-[ChipFamily]-v[Version]-[Channel].bin
-        pattern = r'Sense360-([^-]+)-([^-]+)-v([^-]+)-([^.]+)\.bin'
-        match = re.match(pattern, filename)
+    def extract_metadata_from_path(self, file_path: Path) -> tuple:
+        """Classify a firmware path with the shared grammar.
         
-        if match:
-            device_type, chip_family, version, channel = match.groups()
-            return {
-                'device_type': device_type,
-                'chip_family': chip_family,
-                'version': version,
-                'channel': channel
-            }
-        return None
+        Returns (metadata, None) on success or (None, reason) when the path is rejected.
+        """
+        metadata, reason = self.grammar.classify(file_path.as_posix())
+        if metadata is None:
+            return None, reason
+        
+        device_type = metadata['model']
+        if metadata['sensor_addon']:
+            device_type = f"{metadata['model']}-{metadata['sensor_addon']}"
+        
+        return {
+            'device_type': device_type,
+            'model': metadata['model'],
+            'variant': metadata['variant'],
+            'sensor_addon': metadata['sensor_addon'],
+            'chip_family': self.read_chip_family(file_path),
+            'version': metadata['version'],
+            'channel': metadata['channel']
+        }, None
     
-    def extract_metadata_from_path(self, file_path: Path) -> dict:
-        """Extract metadata from directory structure: firmware/[DeviceType]/[ChipFamily]/[Channel]/"""
-        parts = file_path.parts
-        if len(parts) >= 4:
-            # Extract from directory structure
-            device_type = parts[-4]  # firmware/DeviceType/ChipFamily/Channel/file.bin
-            chip_family = parts[-3]
-            channel = parts[-2]
-            
-            # Extract version from filename
-            filename_metadata = self.extract_metadata_from_filename(file_path.name)
-            version = filename_metadata.get('version', '1.0.0') if filename_metadata else '1.0.0'
-            
-            return {
-                'device_type': device_type,
-                'chip_family': chip_family,
-                'version': version,
-                'channel': channel
-            }
-        return None
+    def read_chip_family(self, bin_file: Path) -> str:
+        """Read "Chip Family" from the release notes next to bin_file; None if unknown."""
+        release_notes_path = bin_file.with_suffix('.md')
+        if not release_notes_path.exists():
+            return None
+        with open(release_notes_path, 'r', encoding='utf-8') as f:
+            content = f.read()
+        device_info_match = re.search(r'## Device Information\s*\n(.*?)(?=\n##|\n$)', content, re.DOTALL)
+        if not device_info_match:
+            return None
+        chip_match = re.search(r'[*\-\s]*Chip Family[*\s]*:\s*(.+)', device_info_match.group(1))
+        return chip_match.group(1).strip() if chip_match else None
     
     def get_chip_family_mapping(self, chip_family: str) -> str:
         """Map chip family to ESP Web Tools format."""
@@ -83,8 +89,8 @@ class FirmwareBinaryManager:
             return firmware_files
             
         for bin_file in self.firmware_dir.rglob("*.bin"):
-            # Extract metadata from directory structure
-            metadata = self.extract_metadata_from_path(bin_file)
+            # Extract metadata from directory structure and filename
+            metadata, reason = self.extract_metadata_from_path(bin_file)
             
             if metadata:
                 firmware_files.append({
@@ -94,9 +100,11 @@ class FirmwareBinaryManager:
                     'size': bin_file.stat().st_size,
                     'modified': datetime.fromtimestamp(bin_file.stat().st_mtime).isoformat()
                 })
-                print(f"Found: {bin_file.name} - {metadata['device_type']} v{metadata['version']} ({metadata['chip_family']})")
+                print(f"Found: {bin_file.name} - {metadata['device_type']} v{metadata['version']} ({metadata['chip_family'] or 'unknown chip family'})")
+                if not metadata['chip_family']:
+                    print(f"Warning: No Chip Family in release notes for {bin_file.name}; chipFamily left out")
             else:
-                print(f"Warning: Could not extract metadata from {bin_file}")
+                print(f"Warning: Skipped {bin_file}: {reason}")
                 
         return firmware_files
     
@@ -111,7 +119,6 @@ class FirmwareBinaryManager:
                 "device_type": metadata['device_type'],
                 "version": metadata['version'],
                 "channel": metadata['channel'],
-                "chipFamily": self.get_chip_family_mapping(metadata['chip_family']),
                 "parts": [{
                     "path": firmware['relative_path'],
                     "offset": 0
@@ -119,6 +126,8 @@ class FirmwareBinaryManager:
                 "build_date": firmware['modified'],
                 "file_size": firmware['size']
             }
+            if metadata['chip_family']:
+                build["chipFamily"] = self.get_chip_family_mapping(metadata['chip_family'])
             
             builds.append(build)
             
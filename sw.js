@@ -0,0 +1,163 @@
+// Service worker for offline and repeat flashing.
+//
+// precache-manifest.json (written by deploy-automation.py) lists the page shell,
+// manifests and selected firmware binaries with their SHA-256 revisions. Each
+// entry is cached under its revision, so a release that changes a file simply
+// lists a new revision and the stale copy is dropped on the next sync.
+//
+// manifest.json and every firmware-N.json are always listed together, so the
+// catalog the page shows and the individual manifest the install button loads
+// come from the same release, even while a newer release syncs in the background.
+
+const PRECACHE = 'webflash-precache-v1';
+const RUNTIME = 'webflash-runtime-v1';
+const PRECACHE_MANIFEST = 'precache-manifest.json';
+const INDEX_KEY = '__precache-index__';
+
+// Cross-origin scripts (ESP Web Tools) cached at runtime so the page works offline
+const RUNTIME_ORIGINS = ['https://unpkg.com'];
+
+let indexPromise = null;
+let syncPromise = null;
+
+function scopeUrl(path) {
+    return new URL(path, self.registration.scope).href;
+}
+
+function cacheKey(entry) {
+    return scopeUrl(`${entry.url}?__rev=${entry.revision}`);
+}
+
+// Path relative to the worker scope, with the scope root mapped to index.html
+function scopePath(url) {
+    const scope = new URL(self.registration.scope);
+    if (url.origin !== scope.origin || !url.pathname.startsWith(scope.pathname)) return null;
+    const path = decodeURIComponent(url.pathname.slice(scope.pathname.length));
+    return path === '' ? 'index.html' : path;
+}
+
+function toHex(buffer) {
+    return [...new Uint8Array(buffer)].map(b => b.toString(16).padStart(2, '0')).join('');
+}
+
+async function loadIndex() {
+    const cache = await caches.open(PRECACHE);
+    const stored = await cache.match(scopeUrl(INDEX_KEY));
+    if (!stored) return { version: null, entries: new Map() };
+    const manifest = await stored.json();
+    return { version: manifest.version, entries: new Map(manifest.entries.map(entry => [entry.url, entry])) };
+}
+
+function getIndex() {
+    if (!indexPromise) indexPromise = loadIndex();
+    return indexPromise;
+}
+
+// Bring the cache in line with the published precache list. Entries are
+// verified against their SHA-256 revision before they are stored.
+async function syncPrecache() {
+    const response = await fetch(scopeUrl(PRECACHE_MANIFEST), { cache: 'no-store' });
+    if (!response.ok) return false;
+    const manifest = await response.json();
+
+    const index = await getIndex();
+    if (index.version === manifest.version) return false;
+
+    const cache = await caches.open(PRECACHE);
+    for (const entry of manifest.entries) {
+        const key = cacheKey(entry);
+        if (await cache.match(key)) continue;
+
+        const fetched = await fetch(scopeUrl(entry.url), { cache: 'no-store' });
+        if (!fetched.ok) throw new Error(`Precache fetch failed for ${entry.url}: ${fetched.status}`);
+        const body = await fetched.arrayBuffer();
+        const digest = toHex(await crypto.subtle.digest('SHA-256', body));
+        if (digest !== entry.revision) throw new Error(`Precache hash mismatch for ${entry.url}`);
+        await cache.put(key, new Response(body, { headers: fetched.headers }));
+    }
+
+    // Drop every cached revision the new list no longer references
+    const wanted = new Set(manifest.entries.map(cacheKey));
+    wanted.add(scopeUrl(INDEX_KEY));
+    for (const request of await cache.keys()) {
+        if (!wanted.has(request.url)) await cache.delete(request);
+    }
+
+    await cache.put(scopeUrl(INDEX_KEY), new Response(JSON.stringify(manifest), {
+        headers: { 'Content-Type': 'application/json' }
+    }));
+    indexPromise = Promise.resolve({
+        version: manifest.version,
+        entries: new Map(manifest.entries.map(entry => [entry.url, entry]))
+    });
+
+    const clients = await self.clients.matchAll({ type: 'window' });
+    clients.forEach(client => client.postMessage({ type: 'precache-updated', version: manifest.version }));
+    return true;
+}
+
+function sync() {
+    if (!syncPromise) {
+        syncPromise = syncPrecache()
+            .catch(error => console.warn('Precache sync failed:', error))
+            .finally(() => { syncPromise = null; });
+    }
+    return syncPromise;
+}
+
+async function precacheFirst(request, path) {
+    const index = await getIndex();
+    const entry = index.entries.get(path);
+    if (entry) {
+        const cached = await caches.match(cacheKey(entry), { cacheName: PRECACHE });
+        if (cached) return cached;
+    }
+    return fetch(request);
+}
+
+async function staleWhileRevalidate(event) {
+    const cache = await caches.open(RUNTIME);
+    const cached = await cache.match(event.request);
+    const network = fetch(event.request).then(response => {
+        if (response.ok) cache.put(event.request, response.clone());
+        return response;
+    });
+    if (cached) {
+        event.waitUntil(network.catch(() => {}));
+        return cached;
+    }
+    return network;
+}
+
+self.addEventListener('install', event => {
+    event.waitUntil(sync().then(() => self.skipWaiting()));
+});
+
+self.addEventListener('activate', event => {
+    event.waitUntil((async () => {
+        const names = await caches.keys();
+        await Promise.all(names
+            .filter(name => name.startsWith('webflash-') && name !== PRECACHE && name !== RUNTIME)
+            .map(name => caches.delete(name)));
+        await self.clients.claim();
+    })());
+});
+
+self.addEventListener('fetch', event => {
+    const request = event.request;
+    // Range requests (resumable downloads) always go to the network
+    if (request.method !== 'GET' || request.headers.has('range')) return;
+
+    const url = new URL(request.url);
+    if (RUNTIME_ORIGINS.includes(url.origin)) {
+        event.respondWith(staleWhileRevalidate(event));
+        return;
+    }
+
+    const path = scopePath(url);
+    if (path === null || path === PRECACHE_MANIFEST || path === 'sw.js') return;
+
+    // Every page load checks for a new release in the background
+    if (request.mode === 'navigate') event.waitUntil(sync());
+    event.respondWith(precacheFirst(request, path));
+});